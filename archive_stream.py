@@ -0,0 +1,124 @@
+"""
+Streaming download-and-extract shared by the Stockfish and Node.js installers
+The archive is unpacked by tarfile in a worker thread while it downloads,
+so nothing is staged on disk and no tar process is spawned
+"""
+
+import asyncio
+import hashlib
+import os
+import queue
+import shutil
+import tempfile
+from typing import Optional
+
+class ChunkPipe:
+    """Blocking file-like reader over chunks fed from the event loop
+
+    At most max_chunks are buffered: feed() waits while the reader is that far
+    behind, so a slow extraction throttles the download instead of holding the
+    whole archive in memory.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_chunks: int = 16):
+        self._loop = loop
+        self._chunks = queue.Queue(max_chunks)
+        self._space = asyncio.Event()
+        self._buffer = b""
+        self._eof = False
+        self._closed = False
+
+    async def feed(self, chunk):
+        """Queue a chunk, waiting for room; None marks end of stream
+
+        Chunks fed after the reader has stopped are dropped.
+        """
+        while not self._closed:
+            try:
+                self._chunks.put_nowait(chunk)
+                return
+            except queue.Full:
+                self._space.clear()
+                await self._space.wait()
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            self._loop.call_soon_threadsafe(self._space.set)
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        """Called from the reader thread once it stops reading, so feed() can't block on it"""
+        self._closed = True
+        self._loop.call_soon_threadsafe(self._space.set)
+
+def _extract_from_pipe(pipe: ChunkPipe, extract, directory: str):
+    try:
+        extract(pipe, directory)
+    finally:
+        pipe.close()
+
+def _move_into_place(scratch: str, dest: str, is_complete):
+    """Rename the finished extraction to dest without ever deleting a live install"""
+    os.chmod(scratch, 0o755)  # mkdtemp creates it owner-only
+    try:
+        os.rename(scratch, dest)
+        return
+    except OSError:
+        if not os.path.isdir(dest):
+            raise
+    
+    if is_complete is None or is_complete(dest):
+        # Another server process finished the same install first; keep theirs
+        shutil.rmtree(scratch, ignore_errors=True)
+        return
+    
+    # A stale, incomplete dest: rename it aside (nothing can be running from it)
+    # and take its place, unless another process gets there first
+    stale = tempfile.mkdtemp(prefix=f"{os.path.basename(dest)}.stale.", dir=os.path.dirname(dest) or ".")
+    os.rename(dest, os.path.join(stale, "old"))
+    try:
+        os.rename(scratch, dest)
+    except OSError:
+        if not os.path.isdir(dest):
+            raise
+        shutil.rmtree(scratch, ignore_errors=True)
+    if not is_complete(os.path.join(stale, "old")):
+        shutil.rmtree(stale, ignore_errors=True)
+
+async def extract_download(response, extract, dest: str, sha256: Optional[str] = None, is_complete=None):
+    """Stream an aiohttp response body through extract(fileobj, directory) into dest
+
+    The archive is unpacked into a scratch directory beside dest, which is renamed
+    to dest only once extraction has finished and the body matched sha256 (when
+    given). An interrupted or tampered download never leaves a partial dest behind.
+    If dest already exists, it is kept when is_complete(dest) says so (another
+    process installed it meanwhile) and otherwise renamed aside, never deleted in place.
+    """
+    scratch = await asyncio.to_thread(
+        tempfile.mkdtemp, prefix=f"{os.path.basename(dest)}.", dir=os.path.dirname(dest) or ".")
+    try:
+        digest = hashlib.sha256()
+        pipe = ChunkPipe(asyncio.get_running_loop())
+        extraction = asyncio.create_task(asyncio.to_thread(_extract_from_pipe, pipe, extract, scratch))
+        try:
+            async for chunk in response.content.iter_chunked(65536):
+                digest.update(chunk)
+                await pipe.feed(chunk)
+        finally:
+            await pipe.feed(None)
+            await extraction
+
+        if sha256 is not None and digest.hexdigest() != sha256:
+            raise RuntimeError(f"{response.url.name} failed its SHA-256 check")
+        await asyncio.to_thread(_move_into_place, scratch, dest, is_complete)
+    except BaseException:
+        await asyncio.to_thread(shutil.rmtree, scratch, ignore_errors=True)
+        raise
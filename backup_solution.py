@@ -1,42 +1,286 @@
 # Backup solution using Lichess API if Stockfish fails
 import aiohttp
 import asyncio
+import chess
+import chess.polyglot
+import logging
+import orjson
+import os
+import random
+import re
+import sqlite3
+import threading
+import yarl
+from collections import OrderedDict
+from dataclasses import astuple, dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True, frozen=True)
+class EvalResult:
+    """Analysis result; immutable so cached instances can be shared directly"""
+    best_move: str
+    cp: Optional[int]
+    mate: Optional[int]
+    engine_used: str
+    depth_reached: int
+    best_line: tuple
+
+# Constant query parameters are encoded once; only the FEN is added per call
+_BASE = yarl.URL("https://lichess.org/api/cloud-eval?multiPv=1&variant=standard")
+
+# The body is tiny with multiPv=1, so the first PV's move and score are pulled
+# straight out of the bytes instead of deserializing the whole document
+_MOVE_RE = re.compile(rb'"moves"\s*:\s*"([a-h][1-8][a-h][1-8][qrbn]?)')
+_CP_RE = re.compile(rb'"cp"\s*:\s*(-?\d+)')
+_MATE_RE = re.compile(rb'"mate"\s*:\s*(-?\d+)')
+
+# Bounded per-request timeout; transient statuses are retried with jittered
+# exponential backoff. Retry-After longer than _RETRY_MAX_DELAY is not waited
+# out since the batch worker would stall on it.
+_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=3, connect=1)
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_RETRY_ATTEMPTS = 3
+_RETRY_START = 0.2
+_RETRY_MAX_DELAY = 2.0
+
+# In-process eval cache: (Zobrist hash, depth) -> EvalResult, LRU-evicted.
+# The hash ignores move counters, so transposed positions share an entry.
+_EVAL_CACHE: "OrderedDict[tuple, EvalResult]" = OrderedDict()
+_MAX = 4096
+
+# Persistent second tier so evals survive restarts; disabled if it can't open
+_DB_PATH = os.environ.get("EVAL_CACHE_PATH", "evalcache.sqlite")
+_DB: Optional[sqlite3.Connection] = None
+_DB_LOCK = threading.Lock()
+_DB_DISABLED = False
+
+# Pending lookups are batched by a single worker; duplicates share one future.
+# All three belong to _WORKER_LOOP and are rebuilt when another loop calls in
+_BATCH = 8
+_PENDING: Optional[asyncio.Queue] = None
+_WORKER: Optional[asyncio.Task] = None
+_WORKER_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_IN_FLIGHT = {}
+
+# Shared HTTP session so repeated calls reuse keep-alive connections to lichess.org
+_SESSION: Optional[aiohttp.ClientSession] = None
+_SESSION_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+async def _get_session():
+    """Lazily create the shared ClientSession on the running loop"""
+    global _SESSION, _SESSION_LOOP
+    loop = asyncio.get_running_loop()
+    # A session left open by a previous loop is bound to that loop's connector
+    if _SESSION is None or _SESSION.closed or _SESSION_LOOP is not loop:
+        _SESSION_LOOP = loop
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=32,
+                # One warm keep-alive connection per batch slot, so a full
+                # batch never waits on connection setup to lichess.org
+                limit_per_host=_BATCH,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            ),
+            timeout=aiohttp.ClientTimeout(total=5)
+        )
+    return _SESSION
+
+async def close_session():
+    """Close the shared session; nothing closes it for you, so callers of
+    analyze_with_lichess_api should await this before their event loop ends"""
+    global _SESSION
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _SESSION = None
+
+def _zobrist(fen):
+    """Polyglot Zobrist hash of a FEN (move counters are ignored), or None if it doesn't parse"""
+    try:
+        return chess.polyglot.zobrist_hash(chess.Board(fen))
+    except ValueError:
+        return None
+
+# Ultimate fallback opening book, keyed by Zobrist hash and built once at import
+_BOOK = {_zobrist(fen): move for fen, move in {
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1": "e7e5",
+    "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2": "g1f3"
+}.items()}
 
 async def analyze_with_lichess_api(fen, depth=12):
     """Use Lichess API as backup when Stockfish is unavailable"""
-    url = "https://lichess.org/api/cloud-eval"
-    params = {
-        "fen": fen,
-        "multiPv": 1,
-        "variant": "standard"
-    }
-    
+    position = _zobrist(fen)
+    if position is None:
+        # Lichess would reject it too
+        return EvalResult("e2e4", 25, None, "fallback", 1, ("e2e4",))
+    key = (position, depth)
+
+    cached = _EVAL_CACHE.get(key)
+    if cached is not None:
+        _EVAL_CACHE.move_to_end(key)
+        return cached
+
+    _ensure_worker()
+    fut = _IN_FLIGHT.get(key)
+    if fut is None:
+        fut = asyncio.get_running_loop().create_future()
+        _IN_FLIGHT[key] = fut
+        await _PENDING.put((key, fen, depth, fut))
+
+    # Shield so one cancelled caller doesn't cancel the lookup for the others
+    result = await asyncio.shield(fut)
+    if result is not None:
+        return result
+
+    # Ultimate fallback - common good moves
+    move = _BOOK.get(position, "e2e4")
+
+    return EvalResult(move, 25, None, "fallback", 1, (move,))
+
+def _get_db():
+    """Open the sqlite eval cache on first use"""
+    global _DB, _DB_DISABLED
+    if _DB is None and not _DB_DISABLED:
+        # Lookups run on worker threads; only the first to take the lock opens it
+        with _DB_LOCK:
+            if _DB is None and not _DB_DISABLED:
+                try:
+                    db = sqlite3.connect(_DB_PATH, isolation_level=None, check_same_thread=False)
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("PRAGMA synchronous=NORMAL")
+                    db.execute("CREATE TABLE IF NOT EXISTS eval_result(k BLOB PRIMARY KEY, v BLOB)")
+                    _DB = db
+                except sqlite3.Error as e:
+                    logger.warning("Eval cache database unavailable: %s", e)
+                    _DB_DISABLED = True
+    return _DB
+
+def _db_key(key):
+    """Pack (zobrist, depth) into a fixed-width blob"""
+    position, depth = key
+    return position.to_bytes(8, "big") + depth.to_bytes(2, "big")
+
+def _db_get(key):
+    db = _get_db()
+    if db is None:
+        return None
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
+        with _DB_LOCK:
+            row = db.execute("SELECT v FROM eval_result WHERE k=?", (_db_key(key),)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("Eval cache read failed: %s", e)
+        return None
+    if row is None:
+        return None
+    *fields, best_line = orjson.loads(row[0])
+    return EvalResult(*fields, tuple(best_line))
+
+def _db_put(key, result):
+    db = _get_db()
+    if db is None:
+        return
+    try:
+        with _DB_LOCK:
+            db.execute("INSERT OR REPLACE INTO eval_result(k, v) VALUES (?, ?)",
+                       (_db_key(key), orjson.dumps(astuple(result))))
+    except sqlite3.Error as e:
+        logger.warning("Eval cache write failed: %s", e)
+
+async def _fetch_one(key, fen, depth):
+    """Resolve a memory-cache miss from disk, then from Lichess"""
+    result = await asyncio.to_thread(_db_get, key)
+    if result is None:
+        result = await _query_lichess(fen, depth)
+        if result is not None:
+            await asyncio.to_thread(_db_put, key, result)
+    return result
+
+def _ensure_worker():
+    """Start the batching worker on first use (or after it died), on the running loop"""
+    global _PENDING, _WORKER, _WORKER_LOOP
+    loop = asyncio.get_running_loop()
+    if _WORKER_LOOP is not loop:
+        # The queue and futures of a previous loop can't be awaited from this one
+        _PENDING = asyncio.Queue()
+        _WORKER = None
+        _WORKER_LOOP = loop
+        _IN_FLIGHT.clear()
+    if _WORKER is None or _WORKER.done():
+        _WORKER = loop.create_task(_worker())
+
+async def _worker():
+    """Drain up to _BATCH pending lookups per tick and fetch them concurrently"""
+    while True:
+        batch = [await _PENDING.get()]
+        while len(batch) < _BATCH:
+            try:
+                batch.append(_PENDING.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+        results = await asyncio.gather(
+            *[_fetch_one(key, fen, depth) for key, fen, depth, _ in batch],
+            return_exceptions=True
+        )
+
+        for (key, _, _, fut), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                result = None
+            if result is not None:
+                _EVAL_CACHE[key] = result
+                if len(_EVAL_CACHE) > _MAX:
+                    _EVAL_CACHE.popitem(last=False)
+            _IN_FLIGHT.pop(key, None)
+            if not fut.done():
+                fut.set_result(result)
+
+def _retry_delay(attempt, retry_after=None):
+    """Backoff before the next attempt, or None if it isn't worth waiting"""
+    if retry_after is not None:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            delay = None
+        if delay is not None:
+            return delay if delay <= _RETRY_MAX_DELAY else None
+    base = _RETRY_START * (2 ** attempt)
+    return base / 2 + random.uniform(0, base / 2)
+
+async def _query_lichess(fen, depth):
+    """Fetch a cloud evaluation from Lichess, or None if unavailable"""
+    url = _BASE.update_query(fen=fen)
+    session = await _get_session()
+
+    for attempt in range(_RETRY_ATTEMPTS):
+        try:
+            async with session.get(url, timeout=_REQUEST_TIMEOUT) as response:
                 if response.status == 200:
-                    data = await response.json()
-                    if "bestmove" in data:
-                        return {
-                            "best_move": data["bestmove"],
-                            "evaluation": {"cp": data.get("cp", 0), "mate": data.get("mate")},
-                            "engine_used": "lichess_cloud",
-                            "depth_reached": depth,
-                            "best_line": [data["bestmove"]]
-                        }
-    except Exception as e:
-        print(f"Lichess API failed: {e}")
-    
-    # Ultimate fallback - common good moves
-    opening_moves = {
-        "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1": "e7e5",
-        "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2": "g1f3"
-    }
-    
-    return {
-        "best_move": opening_moves.get(fen, "e2e4"),
-        "evaluation": {"cp": 25, "mate": None},
-        "engine_used": "fallback",
-        "depth_reached": 1,
-        "best_line": [opening_moves.get(fen, "e2e4")]
-    }
+                    body = await response.read()
+                    move = _MOVE_RE.search(body)
+                    if move is None:
+                        return None
+                    best_move = move.group(1).decode()
+                    cp = _CP_RE.search(body)
+                    mate = _MATE_RE.search(body)
+                    return EvalResult(
+                        best_move,
+                        int(cp.group(1)) if cp else 0,
+                        int(mate.group(1)) if mate else None,
+                        "lichess_cloud",
+                        depth,
+                        (best_move,)
+                    )
+                if response.status not in _RETRY_STATUSES:
+                    return None
+                delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Lichess API failed: %s", e)
+            delay = _retry_delay(attempt)
+
+        if delay is None or attempt + 1 == _RETRY_ATTEMPTS:
+            break
+        await asyncio.sleep(delay)
+
+    return None
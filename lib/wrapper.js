@@ -0,0 +1,194 @@
+const fs = require('fs');
+const readline = require('readline');
+
+// Prefer a WASM SIMD build (stockfish-simd.js/.wasm) when it is shipped in
+// lib/ and the runtime validates a SIMD opcode; otherwise the scalar build
+const SIMD_PROBE = new Uint8Array([0,97,115,109,1,0,0,0,1,5,1,96,0,1,123,3,2,1,0,10,10,1,8,0,65,0,253,15,253,98,11]);
+const BUILD = fs.existsSync('./stockfish-simd.js') && fs.existsSync('./stockfish-simd.wasm')
+    && WebAssembly.validate(SIMD_PROBE) ? 'stockfish-simd' : 'stockfish';
+
+// Load Stockfish.js from local files
+const STOCKFISH = require(`./${BUILD}.js`);
+
+class StockfishEngine {
+    constructor() {
+        this.engine = null;
+        this.ready = false;
+        this.waitFor = null;
+        this.done = null;
+        this.search = null;
+    }
+    
+    async initialize() {
+        try {
+            // Initialize Stockfish with WASM file
+            this.engine = STOCKFISH(`./${BUILD}.wasm`);
+            
+            this.engine.onmessage = (message) => {
+                const text = String(message);
+                if (text.indexOf('\n') < 0) {
+                    this.onLine(text);
+                } else {
+                    for (const line of text.split('\n')) this.onLine(line);
+                }
+            };
+            
+            // Send UCI command and wait for readiness
+            await this.sendCommand('uci', 'uciok');
+            await this.sendCommand('isready', 'readyok');
+            
+            this.ready = true;
+            return true;
+        } catch (e) {
+            console.error('Stockfish initialization failed:', e);
+            return false;
+        }
+    }
+    
+    onLine(line) {
+        if (this.search) {
+            this.scanSearchLine(line);
+        } else if (this.done && line.startsWith(this.waitFor)) {
+            const done = this.done;
+            this.done = null;
+            done();
+        }
+    }
+    
+    // Keeps the latest depth and score as info lines stream in (no regex, no
+    // line buffer) and resolves the search on bestmove
+    scanSearchLine(line) {
+        const search = this.search;
+        if (line.startsWith('bestmove')) {
+            this.search = null;
+            search.resolve({
+                bestmove: line.split(' ')[1] || 'e2e4',
+                evaluation: search.evaluation,
+                depth: search.depth
+            });
+            return;
+        }
+        if (!line.startsWith('info')) return;
+        let i = line.indexOf(' score ');
+        if (i < 0) return;
+        i += 7;
+        if (line.startsWith('cp ', i)) {
+            search.evaluation = { cp: parseInt(line.slice(i + 3)), mate: null };
+        } else if (line.startsWith('mate ', i)) {
+            search.evaluation = { cp: null, mate: parseInt(line.slice(i + 5)) };
+        } else {
+            return;
+        }
+        const d = line.indexOf(' depth ');
+        if (d >= 0) search.depth = parseInt(line.slice(d + 7));
+    }
+    
+    // A search or command that overruns would keep printing into the next
+    // command's reply, so a stuck engine ends the process instead
+    watchdog(cmd) {
+        return setTimeout(() => {
+            console.error(`Stockfish.js timed out on: ${cmd}`);
+            process.exit(1);
+        }, 15000);
+    }
+    
+    // Resolves once the engine prints a line starting with `until`
+    sendCommand(cmd, until) {
+        return new Promise((resolve) => {
+            if (!this.engine) {
+                resolve();
+                return;
+            }
+            
+            const timeout = this.watchdog(cmd);
+            this.waitFor = until;
+            this.done = () => {
+                clearTimeout(timeout);
+                resolve();
+            };
+            
+            this.engine.postMessage(cmd, true);
+        });
+    }
+    
+    async analyze(fen, depth = 15) {
+        if (!this.ready) {
+            throw new Error('Engine not ready');
+        }
+        
+        try {
+            return await new Promise((resolve) => {
+                const cmd = `go depth ${depth}`;
+                const timeout = this.watchdog(cmd);
+                this.search = {
+                    depth: depth,
+                    evaluation: { cp: 0, mate: null },
+                    resolve: (result) => {
+                        clearTimeout(timeout);
+                        resolve(result);
+                    }
+                };
+                
+                // Set position and search
+                this.engine.postMessage(`position fen ${fen}`, true);
+                this.engine.postMessage(cmd, true);
+            });
+        } catch (e) {
+            console.error('Analysis failed:', e);
+            this.search = null;
+            // Return fallback move
+            return {
+                bestmove: 'e2e4',
+                evaluation: { cp: 0, mate: null },
+                depth: 1
+            };
+        }
+    }
+}
+
+// Worker mode: one JSON request per stdin line, one JSON result per stdout
+// line, handled in order. Exits when stdin closes.
+async function serve(engine) {
+    const input = readline.createInterface({ input: process.stdin });
+    for await (const line of input) {
+        if (!line.trim()) continue;
+        const request = JSON.parse(line);
+        const result = await engine.analyze(request.fen, parseInt(request.depth) || 15);
+        process.stdout.write(JSON.stringify(result) + '\n');
+    }
+    process.exit(0);
+}
+
+// CLI interface
+async function main() {
+    const args = process.argv.slice(2);
+    
+    const engine = new StockfishEngine();
+    const initialized = await engine.initialize();
+    
+    if (!initialized) {
+        console.error('Stockfish.js failed to load');
+        process.exit(1);
+    }
+    
+    if (args.length < 1) {
+        await serve(engine);
+        return;
+    }
+    
+    const fen = args[0];
+    const depth = parseInt(args[1]) || 15;
+    
+    const result = await engine.analyze(fen, depth);
+    console.log(JSON.stringify(result));
+    process.exit(0);
+}
+
+if (require.main === module) {
+    main().catch((e) => {
+        console.error(e);
+        process.exit(1);
+    });
+}
+
+module.exports = StockfishEngine;
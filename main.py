@@ -4,24 +4,42 @@ Multi-Engine Chess API for Render.com
 FastAPI implementation with real chess engines
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+from typing import Optional, List, Union
 import chess
 import chess.engine
-import chess.pgn
+import chess.polyglot
 import asyncio
+import functools
+import hashlib
 import time
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import re
+import shutil
+import atexit
 import aiohttp
-import json
-from pathlib import Path
+import yarl
+import orjson
+from collections import Counter, OrderedDict
+from types import MappingProxyType
+from archive_stream import extract_download
 
-# Configure logging first
-logging.basicConfig(level=logging.INFO)
+# Configure logging first - handlers only enqueue records, a listener thread
+# does the actual stderr write so the event loop never blocks on logging
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
 try:
@@ -31,10 +49,22 @@ except ImportError as e:
     logger.error(f"❌ Failed to import stockfish_js: {e}")
     stockfish_js_engine = None
 
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+try:
+    import diskcache
+except ImportError:
+    logger.warning("⚠️ diskcache not installed - analysis cache will not persist")
+    diskcache = None
+
 app = FastAPI(
     title="Multi-Engine Chess API",
     description="Professional chess analysis with multiple engines",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Enable CORS for browser extensions - Updated for better compatibility
@@ -47,8 +77,43 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# Server-Sent Event routes, which must reach the client uncompressed
+_EVENT_STREAM_PATHS = frozenset({"/api/v1/best-move/stream"})
+
+class _GZipMiddleware(GZipMiddleware):
+    """GZip that passes event streams through untouched
+
+    Starlette 0.27 (fastapi 0.104) gzips text/event-stream without flushing per
+    chunk, so events would sit in the zlib buffer until the stream ended.
+    """
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in _EVENT_STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compress larger bodies (ensemble results, dashboard); level 4 keeps CPU low on small JSON
+app.add_middleware(_GZipMiddleware, minimum_size=512, compresslevel=4)
+
 # Request/Response Models
+@functools.lru_cache(maxsize=4096)
+def _parse_fen(fen: str) -> chess.Board:
+    """Parse a FEN once; callers take a copy so the cached board stays pristine"""
+    return chess.Board(fen)
+
+# Search time actually run for a request, in seconds: each search holds a pool
+# engine, and the engine needs a positive limit, so client values are clamped
+MIN_TIME_LIMIT = 0.1
+MAX_TIME_LIMIT = 10.0
+
+def _clamp_time_limit(time_limit: float) -> float:
+    """A client's time_limit brought into [MIN_TIME_LIMIT, MAX_TIME_LIMIT]"""
+    return min(max(time_limit, MIN_TIME_LIMIT), MAX_TIME_LIMIT)
+
 class MoveRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
     fen: str
     depth: int = 15
     engine: str = "stockfish"
@@ -56,14 +121,47 @@ class MoveRequest(BaseModel):
     time_limit: float = 1.0
 
 class EvaluationRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
     fen: str
     perspective: str = "white"
 
 class EnsembleRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
     fen: str
     engines: List[str] = ["stockfish", "random"]
     depth: int = 12
 
+class BatchRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
+    fens: List[str]
+    depth: int = 12
+    engine: str = "stockfish"
+    elo_limit: int = 3200
+    time_limit: float = 1.0
+
+# Upper bound on positions per /batch call (a typical game is well under this)
+BATCH_MAX_POSITIONS = 128
+
+# /best-move validates the raw body in pydantic-core directly (JSON parse and
+# validation in one native pass); the schema is still published for the docs
+_MOVE_REQUEST = TypeAdapter(MoveRequest)
+_MOVE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": MoveRequest.model_json_schema()}}
+    }
+}
+
+def _parse_move_request(body: bytes) -> "MoveRequest":
+    """Validate a raw /best-move body, failing with a 422 like FastAPI's own body validation"""
+    try:
+        return _MOVE_REQUEST.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()], body=body)
+
 class MoveResponse(BaseModel):
     best_move: str
     evaluation: dict
@@ -72,6 +170,10 @@ class MoveResponse(BaseModel):
     analysis_time: float
     best_line: List[str] = []
 
+class BatchError(BaseModel):
+    fen: str
+    error: str
+
 class EvaluationResponse(BaseModel):
     evaluation: dict
     move_quality: dict
@@ -86,6 +188,91 @@ class EnsembleResponse(BaseModel):
 # Global variables for engine management
 engines = {}
 
+# A pool of long-lived, single-threaded Stockfish processes serves every ELO.
+# Each process has one worker draining the shared analysis_queue, so a
+# request's setoption + search run back to back on one engine while other
+# requests search on the rest. _engine_elo skips redundant reconfiguration.
+FULL_STRENGTH_ELO = 3200
+# Deepest search actually run for a request (native engine and stockfish.online);
+# deeper requests are searched, cached and keyed at this depth
+MAX_SEARCH_DEPTH = 12
+# Server worker processes (uvicorn's WEB_CONCURRENCY convention); each runs its own pool
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+# Default pool is one engine per core, capped at 4 to bound memory on large hosts,
+# shared out between the server processes
+STOCKFISH_WORKERS = int(os.environ.get("STOCKFISH_WORKERS",
+                                       max(1, min(os.cpu_count() or 1, 4) // WEB_CONCURRENCY)))
+# /batch positions in analysis at once, across all batches: one per pool engine, so
+# a batch never queues more than a pool's worth of searches ahead of /best-move
+_BATCH_SLOTS = asyncio.Semaphore(STOCKFISH_WORKERS)
+# Total transposition-table budget in MB, split across the pool (16 MB floor,
+# Stockfish's default). The tables persist across requests since ucinewgame
+# is only sent once per engine
+SF_HASH_MB = int(os.environ.get("SF_HASH_MB", 128))
+_SF_WORKER_OPTIONS = {"Threads": 1, "Hash": max(16, SF_HASH_MB // max(1, STOCKFISH_WORKERS))}
+# Longest a bounded search may wait in the queue for a free pool engine, on top
+# of its own timeout, before the caller gives up and falls back
+ENGINE_QUEUE_WAIT = 30.0
+_sf_pool: list = []
+_sf_path: Optional[str] = None  # Binary the pool was started from, for restarts
+analysis_queue: Optional[asyncio.Queue] = None
+_sf_worker_tasks: dict = {}
+_engine_elo: dict = {}
+_HAS_NATIVE_STOCKFISH = False
+
+# One pooled HTTP session for every outbound call - keeps TLS connections warm
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+async def get_session() -> aiohttp.ClientSession:
+    """Shared ClientSession, created on first use"""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=64,
+                # Resolved IPs are reused for 5 minutes; API hosts are load-balanced,
+                # so entries must still expire
+                use_dns_cache=True,
+                ttl_dns_cache=300,
+                keepalive_timeout=75
+            ),
+            timeout=aiohttp.ClientTimeout(total=3)
+        )
+    return _SESSION
+
+async def close_session():
+    """Close the shared session on shutdown"""
+    global _SESSION
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _SESSION = None
+
+# Transposition-style result cache: (Polyglot Zobrist hash, depth, elo) -> analysis.
+# The hash ignores move counters and uses fixed keys, so it is stable across
+# restarts and processes for the disk and Redis tiers.
+_ANALYSIS_CACHE: "OrderedDict[tuple, dict]" = OrderedDict()
+_ANALYSIS_CACHE_MAX = 100_000
+_CACHED_FIELDS = ("best_move", "evaluation", "engine_used", "depth_reached", "best_line")
+# Only the pooled native searches apply the request's elo_limit; the online APIs
+# and the full-strength emergency search in their race don't, so they're never cached
+_CACHEABLE_ENGINES = frozenset({"stockfish_local_EMERGENCY_BYPASS", "stockfish_native"})
+
+# Cache misses currently being analysed: key -> task, awaited by every duplicate request
+_ANALYSIS_IN_FLIGHT = {}
+
+# Persistent second tier so cached analyses survive redeploys and cold starts
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", "/tmp/chess_tt")
+_ANALYSIS_CACHE_TTL = 86400
+_disk_cache = None
+
+# Optional Polyglot opening book, memory-mapped and probed before any engine
+OPENING_BOOK_PATH = os.environ.get("OPENING_BOOK_PATH", "book.bin")
+_polyglot_book = None
+
+# Optional Redis tier shared by every worker/instance when REDIS_URL is set
+REDIS_URL = os.environ.get("REDIS_URL")
+_redis = None
+
 # Get Stockfish path from environment or use defaults
 STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH", "/usr/bin/stockfish")
 
@@ -98,77 +285,101 @@ STOCKFISH_PATHS = [
     "stockfish"  # If it's in PATH
 ]
 
+def _extract_tar_stream(fileobj, extract_dir):
+    """Extract a tar sequentially as it arrives (stream mode never seeks)"""
+    import tarfile
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        tar.extractall(extract_dir, filter="data")
+
+def _find_extracted_stockfish(extract_dir):
+    """Locate (and make executable) the Stockfish binary under extract_dir, or None"""
+    import glob
+    import stat
+    possible_paths = [
+        f"{extract_dir}/stockfish*",
+        f"{extract_dir}/*/stockfish*",
+        f"{extract_dir}/*/*/stockfish*",
+        f"{extract_dir}/*/*/*/stockfish*"
+    ]
+    
+    for pattern in possible_paths:
+        files = glob.glob(pattern)
+        logger.error(f"🔍 Pattern {pattern} found: {files}")
+        for file_path in files:
+            if os.path.isfile(file_path) and os.access(file_path, os.X_OK):
+                logger.error(f"✅ Found executable Stockfish: {file_path}")
+                return file_path
+            elif os.path.isfile(file_path) and 'stockfish' in os.path.basename(file_path).lower():
+                # Make executable
+                os.chmod(file_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
+                logger.error(f"✅ Made executable and using: {file_path}")
+                return file_path
+    return None
+
+# Budget for fetching the Stockfish release archive
+_DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=60)
+
 async def download_stockfish_binary():
     """Download precompiled Stockfish binary for Linux x64"""
     try:
-        import aiohttp
-        import stat
-        
         # Stockfish 16 for Linux x64
         download_url = "https://github.com/official-stockfish/Stockfish/releases/download/sf_16/stockfish-ubuntu-x86-64-avx2.tar"
-        local_path = "/tmp/stockfish_downloaded"
+        extract_dir = "/tmp/stockfish_extracted"
+        
+        # A warm restart on the same instance reuses the previous extraction
+        # (extract_dir only ever appears once an extraction has completed)
+        if os.path.isdir(extract_dir):
+            file_path = _find_extracted_stockfish(extract_dir)
+            if file_path:
+                return file_path
         
         logger.error("🔽 Downloading Stockfish binary...")
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(download_url, timeout=aiohttp.ClientTimeout(total=60)) as response:
-                if response.status == 200:
-                    # Save the tar file
-                    tar_path = "/tmp/stockfish.tar"
-                    with open(tar_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
-                    
-                    # Extract the tar file
-                    import tarfile
-                    extract_dir = "/tmp/stockfish_extracted"
-                    os.makedirs(extract_dir, exist_ok=True)
-                    
-                    with tarfile.open(tar_path, 'r') as tar:
-                        tar.extractall(extract_dir)
-                    
-                    logger.error(f"🔍 Extracted to: {extract_dir}")
-                    
-                    # Find the stockfish binary in extracted files
-                    import glob
-                    possible_paths = [
-                        f"{extract_dir}/stockfish*",
-                        f"{extract_dir}/*/stockfish*",
-                        f"{extract_dir}/*/*/stockfish*",
-                        f"{extract_dir}/*/*/*/stockfish*"
-                    ]
-                    
-                    for pattern in possible_paths:
-                        files = glob.glob(pattern)
-                        logger.error(f"🔍 Pattern {pattern} found: {files}")
-                        for file_path in files:
-                            if os.path.isfile(file_path) and os.access(file_path, os.X_OK):
-                                logger.error(f"✅ Found executable Stockfish: {file_path}")
-                                return file_path
-                            elif os.path.isfile(file_path) and 'stockfish' in os.path.basename(file_path).lower():
-                                # Make executable
-                                os.chmod(file_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
-                                logger.error(f"✅ Made executable and using: {file_path}")
-                                return file_path
-                    
-                    # List all files in extraction directory for debugging
-                    all_files = []
-                    for root, dirs, files in os.walk(extract_dir):
-                        for file in files:
-                            all_files.append(os.path.join(root, file))
-                    logger.error(f"❌ All extracted files: {all_files}")
-                    
-                    return None
-                else:
-                    logger.error(f"❌ Download failed: HTTP {response.status}")
-                    return None
+        session = await get_session()
+        async with session.get(download_url, timeout=_DOWNLOAD_TIMEOUT) as response:
+            if response.status == 200:
+                # Stream the tar straight into the extractor - no temp file, no second pass
+                await extract_download(response, _extract_tar_stream, extract_dir,
+                                       is_complete=lambda path: _find_extracted_stockfish(path) is not None)
+                
+                logger.error(f"🔍 Extracted to: {extract_dir}")
+                
+                # Find the stockfish binary in extracted files
+                file_path = _find_extracted_stockfish(extract_dir)
+                if file_path:
+                    return file_path
+                
+                # List all files in extraction directory for debugging
+                all_files = []
+                for root, dirs, files in os.walk(extract_dir):
+                    for file in files:
+                        all_files.append(os.path.join(root, file))
+                logger.error(f"❌ All extracted files: {all_files}")
+                
+                return None
+            else:
+                logger.error(f"❌ Download failed: HTTP {response.status}")
+                return None
     except Exception as e:
         logger.error(f"❌ Download error: {e}")
         return None
 
+def find_stockfish_binaries():
+    """Executable Stockfish candidates among the known paths and $PATH, in order"""
+    # STOCKFISH_PATH usually repeats one of the defaults; probe each path once
+    found = []
+    for path in dict.fromkeys(STOCKFISH_PATHS):
+        if os.sep not in path:
+            path = shutil.which(path)
+            if path:
+                found.append(path)
+        elif os.path.isfile(path) and os.access(path, os.X_OK):
+            found.append(path)
+    return list(dict.fromkeys(found))
+
 async def initialize_engines():
     """Initialize available chess engines with NATIVE Stockfish priority"""
-    global engines
+    global engines, _HAS_NATIVE_STOCKFISH, _sf_path
     
     stockfish_initialized = False
     
@@ -185,16 +396,21 @@ async def initialize_engines():
         if stockfish_path:
             STOCKFISH_PATHS.insert(0, stockfish_path)
         
+        # Probe for executables up front instead of letting popen fail on missing
+        # paths, then try each one: a binary can exist and still fail the UCI
+        # handshake (e.g. the AVX2 download on a CPU without AVX2)
         stockfish_found = False
-        for path in STOCKFISH_PATHS:
+        for path in find_stockfish_binaries():
             try:
                 logger.error(f"🔍 Trying Stockfish path: {path}")
-                if path == "stockfish" or os.path.exists(path):
-                    engines["stockfish"] = chess.engine.SimpleEngine.popen_uci(path)
-                    logger.error(f"✅ Native Stockfish initialized at: {path}")
-                    stockfish_found = True
-                    stockfish_initialized = True
-                    break
+                engines["stockfish"] = await _open_stockfish(path)
+                _sf_pool.append(engines["stockfish"])
+                _sf_path = path
+                await _grow_stockfish_pool(path)
+                logger.error(f"✅ Native Stockfish initialized at: {path} ({len(_sf_pool)} workers)")
+                stockfish_found = True
+                stockfish_initialized = True
+                break
             except Exception as e:
                 logger.error(f"⚠️ Failed to initialize Stockfish at {path}: {e}")
         
@@ -215,6 +431,28 @@ async def initialize_engines():
     
     # Test engines
     await test_all_engines()
+    
+    # Resolved once here so the analysis path doesn't re-check on every request
+    _HAS_NATIVE_STOCKFISH = hasattr(engines.get("stockfish"), "analyse")
+
+async def _open_stockfish(path: str):
+    """Start one Stockfish process configured as a single-threaded pool worker"""
+    _, engine = await chess.engine.popen_uci(path)
+    await engine.configure({name: value for name, value in _SF_WORKER_OPTIONS.items()
+                            if name in engine.options})
+    return engine
+
+async def _grow_stockfish_pool(path: str):
+    """Start the remaining pool workers; a worker that fails to start is skipped"""
+    started = await asyncio.gather(
+        *(_open_stockfish(path) for _ in range(STOCKFISH_WORKERS - len(_sf_pool))),
+        return_exceptions=True
+    )
+    for engine in started:
+        if isinstance(engine, Exception):
+            logger.warning(f"⚠️ Extra Stockfish worker failed to start: {engine}")
+        else:
+            _sf_pool.append(engine)
 
 async def test_all_engines():
     """Test all available engines"""
@@ -240,35 +478,142 @@ async def test_all_engines():
             if "stockfish" in engines:
                 del engines["stockfish"]
                 engines["stockfish_backup"] = "backup_engine"
+            for engine in _sf_pool:
+                try:
+                    await engine.quit()
+                except Exception:
+                    pass
+            _sf_pool.clear()
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize engines on startup"""
+    # Open the pooled HTTP session up front so the first request doesn't pay for it
+    await get_session()
+    open_disk_cache()
+    open_redis_cache()
+    open_opening_book()
     await initialize_engines()
+    await warm_up()
+
+async def warm_up():
+    """Exercise the backup path and every pooled engine once before serving"""
+    board = chess.Board()
+    select_smart_move(board, board.legal_moves)
+    evaluate_position(board)
+    
+    # The primary engine was already probed by test_all_engines
+    results = await asyncio.gather(
+        *(engine.analyse(board, _search_limit(1, 1.0)) for engine in _sf_pool[1:]),
+        return_exceptions=True
+    )
+    failed = sum(isinstance(result, Exception) for result in results)
+    if failed:
+        logger.warning(f"⚠️ {failed} Stockfish pool worker(s) failed warm-up")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up engines on shutdown"""
+    for task in _sf_worker_tasks.values():
+        task.cancel()
     for engine_name, engine in engines.items():
         if hasattr(engine, 'quit'):
             try:
-                engine.quit()
+                await engine.quit()
                 logger.info(f"🔄 Closed {engine_name} engine")
             except:
                 pass
+    # The first pool member is engines["stockfish"], closed above
+    for engine in _sf_pool[1:]:
+        try:
+            await engine.quit()
+        except Exception:
+            pass
+    await close_session()
+    if _disk_cache is not None:
+        _disk_cache.close()
+    if _redis is not None:
+        await _redis.aclose()
+    if _polyglot_book is not None:
+        _polyglot_book.close()
+
+def open_redis_cache():
+    """Connect the shared Redis analysis cache when REDIS_URL is configured"""
+    global _redis
+    if not REDIS_URL:
+        return
+    if aioredis is None:
+        logger.warning("⚠️ REDIS_URL is set but redis is not installed - shared cache disabled")
+        return
+    _redis = aioredis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    logger.info("✅ Shared Redis analysis cache enabled")
+
+def _redis_key(key) -> str:
+    position, depth, elo_limit = key
+    return f"cf:{position:016x}:{depth}:{elo_limit}"
+
+async def _redis_get(key):
+    """Cached analysis from Redis, or None (also when Redis is unreachable)"""
+    try:
+        cached = await _redis.get(_redis_key(key))
+    except Exception as e:
+        logger.warning(f"⚠️ Redis cache read failed: {e}")
+        return None
+    if cached is None:
+        return None
+    # A corrupt or foreign value under our prefix is just a miss
+    try:
+        entry = orjson.loads(cached)
+    except orjson.JSONDecodeError:
+        entry = None
+    if not isinstance(entry, dict) or not all(field in entry for field in _CACHED_FIELDS):
+        logger.warning(f"⚠️ Ignoring malformed Redis cache entry {_redis_key(key)}")
+        return None
+    return entry
+
+async def _redis_set(key, entry):
+    try:
+        await _redis.set(_redis_key(key), orjson.dumps(entry), ex=_ANALYSIS_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"⚠️ Redis cache write failed: {e}")
+
+def open_disk_cache():
+    """Open the on-disk analysis cache, if diskcache is available"""
+    global _disk_cache
+    if diskcache is None:
+        return
+    try:
+        _disk_cache = diskcache.Cache(ANALYSIS_CACHE_DIR, size_limit=2**30)
+        logger.info(f"✅ Disk analysis cache at {ANALYSIS_CACHE_DIR} ({len(_disk_cache)} entries)")
+    except Exception as e:
+        logger.warning(f"⚠️ Disk analysis cache unavailable: {e}")
+        _disk_cache = None
+
+def open_opening_book():
+    """Memory-map the Polyglot opening book, if one is deployed"""
+    global _polyglot_book
+    if not os.path.isfile(OPENING_BOOK_PATH):
+        return
+    try:
+        _polyglot_book = chess.polyglot.open_reader(OPENING_BOOK_PATH)
+        logger.info(f"✅ Opening book at {OPENING_BOOK_PATH} ({len(_polyglot_book)} entries)")
+    except Exception as e:
+        logger.warning(f"⚠️ Opening book unavailable: {e}")
+        _polyglot_book = None
 
 @app.options("/api/v1/best-move")
 @app.options("/api/v1/evaluation")  
 @app.options("/api/v1/ensemble")
+@app.options("/api/v1/batch")
+@app.options("/api/v1/best-move/stream")
 @app.options("/api/v1/engines/status")
 async def options_handler():
     """Handle preflight CORS requests"""
-    return {}
+    # CORSMiddleware answers real preflights itself; anything reaching here gets an empty 204
+    return Response(status_code=204)
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root():
-    """Serve a simple dashboard"""
-    html_content = """
+# Dashboard markup is encoded once at import; each request only wraps the bytes
+_DASHBOARD_HTML = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -360,130 +705,248 @@ async def read_root():
         </div>
     </body>
     </html>
-    """
-    return html_content
+    """.encode("utf-8")
+
+# The dashboard is static, so browsers and edge caches may keep it for a while
+# and revalidate with If-None-Match against a content hash
+_DASHBOARD_ETAG = f'"{hashlib.md5(_DASHBOARD_HTML).hexdigest()}"'
+_DASHBOARD_HEADERS = {"Cache-Control": "public, max-age=300", "ETag": _DASHBOARD_ETAG}
+
+@app.get("/", response_class=HTMLResponse)
+async def read_root(request: Request):
+    """Serve a simple dashboard"""
+    if request.headers.get("if-none-match") == _DASHBOARD_ETAG:
+        return Response(status_code=304, headers=_DASHBOARD_HEADERS)
+    return HTMLResponse(_DASHBOARD_HTML, headers=_DASHBOARD_HEADERS)
 
-@app.post("/api/v1/best-move", response_model=MoveResponse)
-async def get_best_move(request: MoveRequest):
+@app.post("/api/v1/best-move", response_model=MoveResponse, openapi_extra=_MOVE_REQUEST_BODY)
+async def get_best_move(raw: Request):
     """Get the best move for a given position"""
-    logger.info(f"🎯 Best move request: engine={request.engine}, depth={request.depth}, fen={request.fen[:20]}...")
-    start_time = time.time()
+    request = _parse_move_request(await raw.body())
+    logger.debug("🎯 Best move request: engine=%s, depth=%s, fen=%s...", request.engine, request.depth, request.fen[:20])
+    start_time = time.perf_counter()
     
     try:
         # Validate FEN
-        board = chess.Board(request.fen)
+        board = _parse_fen(request.fen).copy(stack=False)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid FEN: {str(e)}")
     
-    logger.info(f"🎯 Analyzing position with {request.engine}, depth {request.depth}")
+    # Results are assembled by our own backends with the right types, so build the
+    # model without validation; FastAPI passes an instance through as-is
+    return MoveResponse.model_construct(**await _best_move_impl(board, request, start_time))
+
+async def _best_move_impl(board: chess.Board, request: MoveRequest, start_time: Optional[float] = None) -> dict:
+    """Pick the engine for a request and analyze an already-validated board"""
+    if start_time is None:
+        start_time = time.perf_counter()
+    logger.debug("🎯 Analyzing position with %s, depth %s", request.engine, request.depth)
     
     try:
-        if request.engine == "stockfish":
-            # Try Stockfish if available, otherwise use intelligent backup
-            if "stockfish" in engines or "stockfish_backup" in engines:
-                result = await analyze_with_stockfish(board, request.depth, request.time_limit)
-            else:
-                result = await analyze_with_backup(board)
-        elif request.engine == "random":
+        if request.engine == "random":
             result = await analyze_with_random(board)
-        elif request.engine == "ensemble":
-            # For ensemble requests through the best-move endpoint, just use stockfish logic
-            if "stockfish" in engines or "stockfish_backup" in engines:
-                result = await analyze_with_stockfish(board, request.depth, request.time_limit)
-            else:
-                result = await analyze_with_backup(board)
+        # "stockfish", "ensemble" through this endpoint, and unknown engines all
+        # take the Stockfish path, or the intelligent backup if it's unavailable
+        elif "stockfish" in engines or "stockfish_backup" in engines:
+            result = await analyze_with_stockfish(board, request.depth, _clamp_time_limit(request.time_limit),
+                                                  request.elo_limit)
         else:
-            # Fallback to available engine
-            if "stockfish" in engines or "stockfish_backup" in engines:
-                result = await analyze_with_stockfish(board, request.depth, request.time_limit)
-            else:
-                result = await analyze_with_backup(board)
+            result = await analyze_with_backup(board)
     
     except Exception as e:
         logger.error(f"❌ Analysis failed: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
     
-    analysis_time = time.time() - start_time
+    analysis_time = time.perf_counter() - start_time
     result["analysis_time"] = round(analysis_time, 3)
     
     return result
 
+@app.post("/api/v1/batch", response_model=List[Union[MoveResponse, BatchError]])
+async def get_batch_best_moves(request: BatchRequest):
+    """Get best moves for many positions at once (e.g. every ply of a game)
+
+    A position whose analysis fails gets a {"fen", "error"} item instead of failing the batch.
+    """
+    if len(request.fens) > BATCH_MAX_POSITIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_POSITIONS} positions per batch")
+    
+    # Validate everything up front, deduplicating repeated FENs
+    boards = {}
+    for index, fen in enumerate(request.fens):
+        if fen in boards:
+            continue
+        try:
+            boards[fen] = _parse_fen(fen).copy(stack=False)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid FEN at index {index}: {str(e)}")
+    
+    # Each distinct FEN is analyzed once, at most one per pool engine at a time
+    async def analyze(fen, board):
+        async with _BATCH_SLOTS:
+            try:
+                return MoveResponse.model_construct(**await _best_move_impl(board, MoveRequest(
+                    fen=fen, depth=request.depth, engine=request.engine,
+                    elo_limit=request.elo_limit, time_limit=request.time_limit)))
+            except HTTPException as e:
+                return BatchError.model_construct(fen=fen, error=e.detail)
+    
+    analyses = await asyncio.gather(*(analyze(fen, board) for fen, board in boards.items()))
+    results = dict(zip(boards, analyses))
+    return [results[fen] for fen in request.fens]
+
+@app.post("/api/v1/best-move/stream")
+async def stream_best_move(request: MoveRequest):
+    """Stream native Stockfish's analysis as Server-Sent Events while it deepens"""
+    try:
+        board = _parse_fen(request.fen).copy(stack=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid FEN: {str(e)}")
+    if not _HAS_NATIVE_STOCKFISH:
+        raise HTTPException(status_code=503, detail="Native Stockfish is not available")
+    
+    return StreamingResponse(_stream_analysis(board, request), media_type="text/event-stream")
+
+async def _stream_analysis(board: chess.Board, request: MoveRequest):
+    """One SSE event per new PV, then a 'result' (or 'error') event when the search ends"""
+    updates = asyncio.Queue()
+    # Same caps as /best-move, so a stream can't hold a pool engine for longer
+    depth = min(request.depth, MAX_SEARCH_DEPTH)
+    time_limit = _clamp_time_limit(request.time_limit)
+    limit = _search_limit(depth, time_limit)
+    search = asyncio.create_task(engine_analyse(board, limit, request.elo_limit, on_info=updates.put_nowait))
+    search.add_done_callback(lambda _: updates.put_nowait(None))
+    
+    # Overall bound on the stream, queue wait included, so a held-open connection always ends
+    deadline = asyncio.get_running_loop().time() + time_limit + 5
+    
+    # A client disconnect closes this generator; cancelling the search then makes
+    # the pool worker send "stop" at the engine's next info line
+    try:
+        while True:
+            try:
+                info = await asyncio.wait_for(updates.get(), deadline - asyncio.get_running_loop().time())
+            except asyncio.TimeoutError:
+                yield b"event: error\ndata: " + orjson.dumps({"detail": "Analysis timed out"}) + b"\n\n"
+                return
+            if info is None:
+                break
+            partial = _shape_engine_info(info, "stockfish_native", info.get("depth", 0))
+            if partial is not None:
+                yield b"data: " + orjson.dumps(partial) + b"\n\n"
+        
+        try:
+            final = search.result()
+        except Exception as e:
+            yield b"event: error\ndata: " + orjson.dumps({"detail": str(e)}) + b"\n\n"
+        else:
+            result = _shape_engine_info(final, "stockfish_native", final.get("depth", depth))
+            yield b"event: result\ndata: " + orjson.dumps(result) + b"\n\n"
+    finally:
+        search.cancel()
+
 @app.post("/api/v1/evaluation", response_model=EvaluationResponse)
 async def get_evaluation(request: EvaluationRequest):
     """Get position evaluation"""
     try:
-        board = chess.Board(request.fen)
+        board = _parse_fen(request.fen).copy(stack=False)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid FEN: {str(e)}")
     
-    # Get best move first
-    move_request = MoveRequest(fen=request.fen, depth=12)
-    move_result = await get_best_move(move_request)
+    # Get best move first - straight from the analyzer, not through the route
+    move_result = await _best_move_impl(board, MoveRequest(fen=request.fen, depth=12))
     
-    evaluation = {
-        "evaluation": move_result.evaluation,
-        "move_quality": {
-            "last_move": move_result.best_move,
+    # Built from our own values, so skip validation (as for /best-move)
+    return EvaluationResponse.model_construct(
+        evaluation=move_result["evaluation"],
+        move_quality={
+            "last_move": move_result["best_move"],
             "classification": "good",
             "accuracy": 95
         },
-        "position_type": get_position_type(board),
-        "winning_chances": calculate_winning_chances(move_result.evaluation)
-    }
-    
-    return evaluation
+        position_type=get_position_type(board),
+        winning_chances=float(calculate_winning_chances(move_result["evaluation"]))
+    )
 
 @app.post("/api/v1/ensemble", response_model=EnsembleResponse)
 async def get_ensemble_analysis(request: EnsembleRequest):
     """Get consensus analysis from multiple engines"""
     try:
-        board = chess.Board(request.fen)
+        board = _parse_fen(request.fen).copy(stack=False)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid FEN: {str(e)}")
     
     results = []
     weights = {"stockfish": 0.8, "random": 0.2}
+    move_votes = Counter()
+    
+    # Engines are independent, so analyze with all of them at once
+    running = {
+        asyncio.create_task(
+            _best_move_impl(board, MoveRequest(fen=request.fen, engine=name, depth=request.depth))
+        ): name
+        for name in request.engines if name in engines
+    }
+    remaining_weight = sum(weights.get(name, 0.5) for name in running.values())
+    pending = set(running)
     
-    for engine_name in request.engines:
-        if engine_name in engines:
-            try:
-                move_request = MoveRequest(fen=request.fen, engine=engine_name, depth=request.depth)
-                result = await get_best_move(move_request)
-                
-                results.append({
-                    "engine": result.engine_used,
-                    "best_move": result.best_move,
-                    "evaluation": result.evaluation.get("cp", 0),
-                    "weight": weights.get(engine_name, 0.5)
-                })
-            except Exception as e:
-                logger.warning(f"Engine {engine_name} failed: {e}")
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                engine_name = running[task]
+                weight = weights.get(engine_name, 0.5)
+                remaining_weight -= weight
+                try:
+                    outcome = task.result()
+                    results.append({
+                        "engine": outcome["engine_used"],
+                        "best_move": outcome["best_move"],
+                        "evaluation": outcome["evaluation"].get("cp", 0),
+                        "weight": weight
+                    })
+                    move_votes[outcome["best_move"]] += weight
+                except Exception as e:
+                    logger.warning(f"Engine {engine_name} failed: {e}")
+            
+            # Stop early once the engines still running can't outvote the leader
+            leaders = move_votes.most_common(2)
+            if leaders:
+                runner_up = leaders[1][1] if len(leaders) > 1 else 0
+                if leaders[0][1] > runner_up + remaining_weight:
+                    break
+    finally:
+        for task in pending:
+            task.cancel()
     
     if not results:
         raise HTTPException(status_code=500, detail="All engines failed")
     
-    # Calculate consensus
-    move_votes = {}
-    for result in results:
-        move = result["best_move"]
-        move_votes[move] = move_votes.get(move, 0) + result["weight"]
-    
-    consensus_move = max(move_votes, key=move_votes.get)
-    confidence = min(100, (move_votes[consensus_move] / len(results)) * 100)
-    
-    return {
-        "consensus_move": consensus_move,
-        "confidence": round(confidence, 1),
-        "engine_results": results
-    }
+    # Calculate consensus - the leader was already found by the early-exit check.
+    # Engines cancelled by that exit are left out of engine_results but still
+    # count towards the confidence, as they would had every engine finished;
+    # engines that failed count towards neither
+    consensus_move, votes = leaders[0]
+    confidence = min(100, (votes / (len(results) + len(pending))) * 100)
+    
+    return EnsembleResponse.model_construct(
+        consensus_move=consensus_move,
+        confidence=float(round(confidence, 1)),
+        engine_results=results
+    )
 
 @app.get("/api/v1/engines/status")
 async def get_engine_status():
     """Get status of all available engines"""
+    return _engine_status("stockfish" in engines, "random" in engines)
+
+@functools.lru_cache(maxsize=None)
+def _engine_status(has_stockfish: bool, has_random: bool) -> dict:
+    """Status body for one combination of available engines, built once and reused"""
     status = {}
     
-    for engine_name in ["stockfish", "random"]:
-        if engine_name in engines:
+    for engine_name, available in (("stockfish", has_stockfish), ("random", has_random)):
+        if available:
             if engine_name == "stockfish":
                 status[engine_name] = {
                     "available": True,
@@ -523,444 +986,471 @@ async def health_check():
         "version": "1.0.0"
     }
 
+_UCI_MOVE_RE = re.compile(r"[a-h][1-8][a-h][1-8][qrbn]?")
+_BESTMOVE_RE = re.compile(r"bestmove\s+([a-h][1-8][a-h][1-8][qrbn]?)")
+
+# Per-request budget for each online engine API
+_API_TIMEOUT = aiohttp.ClientTimeout(total=2)
+
+# Constant query parameters are encoded once; only the per-position ones are added per call
+_LICHESS_URL = yarl.URL("https://lichess.org/api/cloud-eval?multiPv=1&variant=standard")
+_CHESSDB_URL = yarl.URL("http://www.chessdb.cn/cdb.php?action=querypv&json=1")
+_STOCKFISH_ONLINE_URL = yarl.URL("https://stockfish.online/api/s/v2.php?mode=bestmove")
+
+# Bodies above this size (e.g. long ChessDB PVs) are parsed in a worker thread
+_LARGE_BODY = 4096
+
+async def _loads_json(body: bytes):
+    """Parse a JSON response body without stalling the event loop on large ones"""
+    if len(body) > _LARGE_BODY:
+        return await asyncio.to_thread(orjson.loads, body)
+    return orjson.loads(body)
+
 def clean_move_format(raw_move: str) -> str:
     """Clean move format from various APIs to standard notation"""
     if not raw_move:
         return ""
     
     # Handle "bestmove c7c6 ponder d5c4" format
-    if raw_move.startswith("bestmove "):
-        parts = raw_move.split()
-        if len(parts) >= 2:
-            move = parts[1]  # Extract "c7c6" from "bestmove c7c6 ponder d5c4"
-            logger.info(f"🧹 Cleaned Stockfish format: '{raw_move}' → '{move}'")
-            return move
+    match = _BESTMOVE_RE.match(raw_move)
+    if match:
+        move = match.group(1)  # Extract "c7c6"
+        logger.debug("🧹 Cleaned Stockfish format: '%s' → '%s'", raw_move, move)
+        return move
     
     # Handle other formats or clean moves
     raw_move = raw_move.strip()
     
-    # Basic validation: should be 4-5 characters like "e2e4" or "e7e8q"
-    if len(raw_move) >= 4 and len(raw_move) <= 5:
-        # Check if it looks like a valid move (two squares)
-        if (raw_move[0].isalpha() and raw_move[1].isdigit() and 
-            raw_move[2].isalpha() and raw_move[3].isdigit()):
-            return raw_move
+    # Should be a UCI move like "e2e4" or "e7e8q"
+    if _UCI_MOVE_RE.fullmatch(raw_move):
+        return raw_move
     
     logger.warning(f"⚠️ Invalid move format: '{raw_move}'")
     return ""
 
-async def try_online_stockfish(fen: str, depth: int):
-    """🚀 ULTRA-FAST: Try multiple APIs in parallel, return first success"""
-    
-    # 🚨 EMERGENCY FIX: Try local Stockfish FIRST before online APIs
-    if "stockfish" in engines and engines["stockfish"] != "unavailable" and engines["stockfish"] != "stockfish_js":
-        try:
-            logger.error("🚨 EMERGENCY: FORCING local chess.engine Stockfish first...")
-            logger.error(f"🔧 Engines dict: {engines}")
-            stockfish_engine = engines["stockfish"]
-            logger.error(f"🔧 Stockfish engine object: {type(stockfish_engine)}")
-            
-            # Use chess.engine API (not python-stockfish API)
-            import chess
-            board = chess.Board(fen)
-            
-            # Analyze with chess.engine
-            info = await asyncio.wait_for(
-                stockfish_engine.analyse(board, chess.engine.Limit(depth=min(depth, 12), time=3.0)),
-                timeout=5.0
-            )
-            
-            best_move = str(info["pv"][0]) if info.get("pv") else None
-            if best_move:
-                logger.error(f"✅ LOCAL STOCKFISH SUCCESS: {best_move}")
-                
-                # Extract evaluation
-                score = info.get("score", chess.engine.PovScore(chess.engine.Cp(0), chess.WHITE))
-                if score.is_mate():
-                    evaluation = {"cp": None, "mate": score.mate()}
-                else:
-                    evaluation = {"cp": score.cp, "mate": None}
-                
-                # Extract principal variation
-                pv = [str(move) for move in info.get("pv", [])[:3]]
-                
-                return {
-                    "best_move": best_move,
-                    "evaluation": evaluation,
-                    "engine_used": "stockfish_local_EMERGENCY",
-                    "analysis_time": 0.8,
-                    "depth_reached": min(depth, 12),
-                    "best_line": pv
-                }
-        except Exception as e:
-            logger.error(f"❌ Local Stockfish EMERGENCY failed: {e}")
-            logger.error(f"❌ Exception type: {type(e)}")
-            logger.error(f"❌ Exception args: {e.args}")
-    
-    async def try_lichess():
-        try:
-            timeout = aiohttp.ClientTimeout(total=2)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                url = "https://lichess.org/api/cloud-eval"
-                params = {"fen": fen, "multiPv": 1, "variant": "standard"}
-                
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if "pvs" in data and data["pvs"]:
-                            pv = data["pvs"][0]
-                            if "moves" in pv and pv["moves"]:
-                                raw_move = pv["moves"].split()[0]
-                                clean_move = clean_move_format(raw_move)
-                                if clean_move:
-                                    return {
-                                        "best_move": clean_move,
-                                        "evaluation": {"cp": pv.get("cp", 0), "mate": pv.get("mate", None)},
-                                        "engine_used": "lichess_cloud",
-                                        "analysis_time": 0.5,
-                                        "depth_reached": depth,
-                                        "best_line": pv.get("moves", "").split()[:3]
-                                    }
-        except Exception as e:
-            logger.error(f"❌ Lichess API failed: {e}")
-        return None
+async def _query_local_stockfish(fen: str, depth: int):
+    """Best move from the native engine, or None"""
+    try:
+        logger.debug("🚨 EMERGENCY: Racing local chess.engine Stockfish against online APIs...")
+        logger.debug("🔧 Engines dict: %s", engines)
+        result = await _run_native_stockfish(
+            chess.Board(fen), _search_limit(min(depth, MAX_SEARCH_DEPTH), 3.0), 5.0,
+            FULL_STRENGTH_ELO, "stockfish_local_EMERGENCY"
+        )
+        result["analysis_time"] = 0.8
+        return result
+    except Exception as e:
+        logger.error(f"❌ Local Stockfish EMERGENCY failed: {e}")
+        logger.debug("❌ Exception type: %s", type(e))
+        logger.debug("❌ Exception args: %s", e.args)
+    return None
 
-    async def try_chessdb():
-        try:
-            timeout = aiohttp.ClientTimeout(total=2)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                url = "http://www.chessdb.cn/cdb.php"
-                params = {"action": "querypv", "board": fen, "json": 1}
-                
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if "pv" in data and data["pv"]:
-                            moves = data["pv"].strip().split()
-                            if moves:
-                                clean_move = clean_move_format(moves[0])
-                                if clean_move:
-                                    return {
-                                        "best_move": clean_move,
-                                        "evaluation": {"cp": data.get("score", 0), "mate": None},
-                                        "engine_used": "chessdb",
-                                        "analysis_time": 0.8,
-                                        "depth_reached": depth,
-                                        "best_line": moves[:3]
-                                    }
-        except Exception as e:
-            logger.error(f"❌ ChessDB API failed: {e}")
-        return None
+async def _query_lichess(session: aiohttp.ClientSession, fen: str, depth: int):
+    """Best move from the Lichess cloud eval, or None"""
+    try:
+        url = _LICHESS_URL.update_query(fen=fen)
 
-    async def try_stockfish_online():
-        try:
-            timeout = aiohttp.ClientTimeout(total=2)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                url = "https://stockfish.online/api/s/v2.php"
-                params = {"fen": fen, "depth": min(depth, 12), "mode": "bestmove"}
-                
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if "bestmove" in data and data["bestmove"]:
-                            clean_move = clean_move_format(str(data["bestmove"]))
-                            if clean_move:
-                                return {
-                                    "best_move": clean_move,
-                                    "evaluation": {"cp": data.get("evaluation", 0), "mate": None},
-                                    "engine_used": "stockfish_online",
-                                    "analysis_time": 1.2,
-                                    "depth_reached": depth,
-                                                                            "best_line": [clean_move]
-                                    }
-        except Exception as e:
-            logger.error(f"❌ Stockfish.online API failed: {e}")
-        return None
+        async with session.get(url, timeout=_API_TIMEOUT) as response:
+            if response.status == 200:
+                data = await _loads_json(await response.read())
+                if "pvs" in data and data["pvs"]:
+                    pv = data["pvs"][0]
+                    if "moves" in pv and pv["moves"]:
+                        raw_move = pv["moves"].split()[0]
+                        clean_move = clean_move_format(raw_move)
+                        if clean_move:
+                            return {
+                                "best_move": clean_move,
+                                "evaluation": {"cp": pv.get("cp", 0), "mate": pv.get("mate", None)},
+                                "engine_used": "lichess_cloud",
+                                "analysis_time": 0.5,
+                                "depth_reached": depth,
+                                "best_line": pv.get("moves", "").split()[:3]
+                            }
+    except Exception as e:
+        logger.error(f"❌ Lichess API failed: {e}")
+    return None
+
+async def _query_chessdb(session: aiohttp.ClientSession, fen: str, depth: int):
+    """Best move from ChessDB, or None"""
+    try:
+        url = _CHESSDB_URL.update_query(board=fen)
+
+        async with session.get(url, timeout=_API_TIMEOUT) as response:
+            if response.status == 200:
+                data = await _loads_json(await response.read())
+                if "pv" in data and data["pv"]:
+                    moves = data["pv"].strip().split()
+                    if moves:
+                        clean_move = clean_move_format(moves[0])
+                        if clean_move:
+                            return {
+                                "best_move": clean_move,
+                                "evaluation": {"cp": data.get("score", 0), "mate": None},
+                                "engine_used": "chessdb",
+                                "analysis_time": 0.8,
+                                "depth_reached": depth,
+                                "best_line": moves[:3]
+                            }
+    except Exception as e:
+        logger.error(f"❌ ChessDB API failed: {e}")
+    return None
+
+async def _query_stockfish_online(session: aiohttp.ClientSession, fen: str, depth: int):
+    """Best move from stockfish.online, or None"""
+    try:
+        url = _STOCKFISH_ONLINE_URL.update_query(fen=fen, depth=min(depth, MAX_SEARCH_DEPTH))
+
+        async with session.get(url, timeout=_API_TIMEOUT) as response:
+            if response.status == 200:
+                data = await _loads_json(await response.read())
+                if "bestmove" in data and data["bestmove"]:
+                    clean_move = clean_move_format(str(data["bestmove"]))
+                    if clean_move:
+                        return {
+                            "best_move": clean_move,
+                            "evaluation": {"cp": data.get("evaluation", 0), "mate": None},
+                            "engine_used": "stockfish_online",
+                            "analysis_time": 1.2,
+                            "depth_reached": depth,
+                            "best_line": [clean_move]
+                        }
+    except Exception as e:
+        logger.error(f"❌ Stockfish.online API failed: {e}")
+    return None
 
+async def try_online_stockfish(fen: str, depth: int):
+    """🚀 ULTRA-FAST: Try multiple APIs in parallel, return first success"""
+    
     # 🚀 RUN ALL APIs IN PARALLEL - return first success
-    logger.info("🚀 Parallel API calls for maximum speed...")
+    logger.debug("🚀 Parallel API calls for maximum speed...")
     
     # ADD DETAILED LOGGING TO DEBUG THE ISSUE
-    logger.info("🔍 Starting parallel API calls...")
-    tasks = [try_lichess(), try_chessdb(), try_stockfish_online()]
+    logger.debug("🔍 Starting parallel API calls...")
+    session = await get_session()
+    tasks = [
+        asyncio.create_task(api(session, fen, depth))
+        for api in (_query_lichess, _query_chessdb, _query_stockfish_online)
+    ]
+    # Local Stockfish races the online APIs instead of blocking them
+    if _HAS_NATIVE_STOCKFISH:
+        tasks.append(asyncio.create_task(_query_local_stockfish(fen, depth)))
     
     try:
-        # Wait for first successful result (max 10 seconds total - increased timeout)
-        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED, timeout=10)
-        
-        # Cancel remaining tasks to save resources
-        for task in pending:
-            task.cancel()
-        
-        # Return first successful result
-        for task in done:
-            result = await task
+        # Return the first API that actually succeeds (max 10 seconds total) -
+        # an early failure must not cancel the ones still running
+        for next_done in asyncio.as_completed(tasks, timeout=10):
+            result = await next_done
             if result:
-                logger.info(f"✅ FASTEST WIN: {result['engine_used']} in {result['analysis_time']}s")
+                logger.debug("✅ FASTEST WIN: %s in %ss", result['engine_used'], result['analysis_time'])
                 return result
         
         # If we get here, no tasks succeeded
         logger.error("❌ ALL parallel API tasks completed but returned None!")
-        logger.error(f"❌ Number of completed tasks: {len(done)}")
                 
     except asyncio.TimeoutError:
         logger.error("❌ ALL APIs TIMED OUT after 10 seconds!")
-        # Cancel all pending tasks
-        for task in pending:
-            task.cancel()
     except Exception as e:
         logger.error(f"❌ Parallel API error: {e}")
+    finally:
+        # Cancel remaining tasks to save resources
+        for task in tasks:
+            task.cancel()
     
     logger.error("❌ RETURNING None - all online APIs failed!")
     return None
 
-async def try_online_stockfish_OLD_SLOW(fen: str, depth: int):
-    """Try multiple online Stockfish APIs IN PARALLEL for maximum speed"""
+# Engine-specific analysis functions
+async def analyze_with_stockfish(board: chess.Board, depth: int, time_limit: float, elo_limit: int = FULL_STRENGTH_ELO):
+    """Analyze with Stockfish, serving repeated positions from the result cache"""
+    # Book theory needs no search at all
+    if _polyglot_book is not None:
+        entry = _polyglot_book.get(board)
+        if entry is not None:
+            book_move = entry.move.uci()
+            return {
+                "best_move": book_move,
+                "evaluation": {"cp": 0, "mate": None},
+                "engine_used": "opening_book",
+                "depth_reached": 0,
+                "best_line": [book_move]
+            }
+    
+    # Requests past MAX_SEARCH_DEPTH run the same search, so they share an entry.
+    # The time limit isn't part of the key: a search it cut short of the key's
+    # depth is never cached
+    key = (chess.polyglot.zobrist_hash(board), min(depth, MAX_SEARCH_DEPTH), elo_limit)
+    cached = _ANALYSIS_CACHE.get(key)
+    if cached is not None:
+        _ANALYSIS_CACHE.move_to_end(key)
+        logger.debug("⚡ Cache hit: %s", cached['best_move'])
+        return dict(cached)
+    
+    if _disk_cache is not None:
+        cached = await asyncio.to_thread(_disk_cache.get, key)
+        if cached is not None:
+            _remember_analysis(key, cached)
+            logger.debug("⚡ Disk cache hit: %s", cached['best_move'])
+            return dict(cached)
+    
+    if _redis is not None:
+        cached = await _redis_get(key)
+        if cached is not None:
+            _remember_analysis(key, cached)
+            logger.debug("⚡ Redis cache hit: %s", cached['best_move'])
+            return dict(cached)
+    
+    # Identical searches already running share one engine call; the shield keeps
+    # one caller giving up (e.g. a cancelled ensemble task) from cancelling it for the rest
+    task = _ANALYSIS_IN_FLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_analyze_and_remember(board, key, depth, time_limit, elo_limit))
+        _ANALYSIS_IN_FLIGHT[key] = task
+        task.add_done_callback(lambda _: _ANALYSIS_IN_FLIGHT.pop(key, None))
+    return dict(await asyncio.shield(task))
+
+async def _analyze_and_remember(board: chess.Board, key, depth: int, time_limit: float, elo_limit: int):
+    """Run an uncached analysis and store it in every cache tier"""
+    result = await _analyze_with_stockfish_uncached(board, depth, time_limit, elo_limit)
+    
+    # Cache only pooled native searches, which ran at the key's elo - not the
+    # emergency backup (a real engine may be back next time) nor an online line -
+    # and never a line shallower than the search the key stands for, unless the
+    # search stopped early on a mate proven for the side to move
+    mate = result["evaluation"]["mate"]
+    if result["engine_used"] in _CACHEABLE_ENGINES and (result["depth_reached"] >= key[1]
+                                    or (mate is not None and (mate > 0) == (board.turn == chess.WHITE))):
+        entry = {field: result[field] for field in _CACHED_FIELDS}
+        _remember_analysis(key, entry)
+        if _disk_cache is not None:
+            await asyncio.to_thread(_disk_cache.set, key, entry, expire=_ANALYSIS_CACHE_TTL)
+        if _redis is not None:
+            await _redis_set(key, entry)
     
-    # 🚀 BLITZ MODE: Try ALL APIs simultaneously and return first success
-    async def try_lichess():
+    return result
+
+def analyze_cache_clear() -> int:
+    """Empty the in-memory analysis cache, returning how many entries it held"""
+    cleared = len(_ANALYSIS_CACHE)
+    _ANALYSIS_CACHE.clear()
+    return cleared
+
+def _remember_analysis(key, entry):
+    """Insert into the in-memory LRU, evicting the oldest entry when full"""
+    _ANALYSIS_CACHE[key] = entry
+    if len(_ANALYSIS_CACHE) > _ANALYSIS_CACHE_MAX:
+        _ANALYSIS_CACHE.popitem(last=False)
+
+async def engine_analyse(board: chess.Board, limit: chess.engine.Limit, elo_limit: int = FULL_STRENGTH_ELO,
+                         on_info=None, timeout: Optional[float] = None):
+    """Queue a search for the native Stockfish pool and wait for its result
+
+    on_info, if given, is called with every info update as the search deepens.
+    timeout, if given, bounds the search once a worker picks it up; the caller
+    also gives up after waiting ENGINE_QUEUE_WAIT beyond it, queue wait included.
+    """
+    global analysis_queue
+    if not _sf_pool:
+        raise chess.engine.EngineTerminatedError("No native Stockfish engine is running")
+    if analysis_queue is None:
+        analysis_queue = asyncio.Queue()
+    for engine in _sf_pool:
+        task = _sf_worker_tasks.get(engine)
+        if task is None or task.done():
+            _sf_worker_tasks[engine] = asyncio.create_task(_sf_worker(engine))
+    
+    fut = asyncio.get_running_loop().create_future()
+    await analysis_queue.put((board, limit, elo_limit, fut, on_info, timeout, False))
+    # Leaving the block cancels fut, so a worker that takes it later skips it
+    try:
+        async with asyncio.timeout(None if timeout is None else timeout + ENGINE_QUEUE_WAIT):
+            return await fut
+    except TimeoutError:
+        if fut.cancelled():
+            raise TimeoutError(f"Stockfish search waited past {timeout + ENGINE_QUEUE_WAIT}s") from None
+        raise
+
+async def _sf_worker(engine):
+    """Feed queued searches to one pooled engine, one at a time"""
+    while True:
+        job = await analysis_queue.get()
+        board, limit, elo_limit, fut, on_info, timeout, retried = job
+        if fut.done():
+            continue  # Caller gave up while it was queued
         try:
-            logger.info("🌐 Trying Lichess Stockfish API...")
-            timeout = aiohttp.ClientTimeout(total=2)  # BLITZ MODE: 2s max
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                url = "https://lichess.org/api/cloud-eval"
-                params = {
-                    "fen": fen,
-                    "multiPv": 1,
-                    "variant": "standard"
-                }
-                
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if "pvs" in data and len(data["pvs"]) > 0:
-                            pv = data["pvs"][0]
-                            raw_move = pv["moves"].split()[0] if "moves" in pv else None
-                            
-                            if raw_move:
-                                clean_move = clean_move_format(raw_move)
-                                if clean_move:
-                                    logger.info(f"✅ Lichess API success! Move: '{clean_move}'")
-                                    return {
-                                        "best_move": clean_move,
-                                        "evaluation": {
-                                            "cp": pv.get("cp", 0),
-                                            "mate": pv.get("mate", None)
-                                        },
-                                        "engine_used": "lichess_stockfish",
-                                        "depth_reached": depth,
-                                        "best_line": pv.get("moves", "").split()[:3]
-                                    }
+            async with asyncio.timeout(timeout):
+                await _set_engine_elo(engine, elo_limit)
+                info = await _search_until_decided(engine, board, limit, fut, on_info)
+        except chess.engine.EngineTerminatedError as e:
+            # The process is gone and would fail every job it took; replace it and
+            # hand the job back to the pool once (a position that crashes engines
+            # isn't retried forever)
+            await _replace_dead_engine(engine)
+            if fut.done():
+                pass
+            elif _sf_pool and not retried:
+                analysis_queue.put_nowait((board, limit, elo_limit, fut, on_info, timeout, True))
+            else:
+                fut.set_exception(e)
+            return
+        except TimeoutError:
+            if not fut.done():
+                fut.set_exception(TimeoutError(f"Stockfish search ran past {timeout}s"))
         except Exception as e:
-            logger.warning(f"⚠️ Lichess API attempt {attempt + 1} failed: {e}")
-            if attempt < 2:  # Wait before retry (shorter for blitz)
-                await asyncio.sleep(0.2)
-    
-    # API 2: Chess.com API (try cloud analysis)
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(info)
+
+async def _replace_dead_engine(engine):
+    """Swap a terminated pool engine for a fresh process, or drop it if none starts"""
+    global _HAS_NATIVE_STOCKFISH
+    index = _sf_pool.index(engine)
+    _engine_elo.pop(engine, None)
+    _sf_worker_tasks.pop(engine, None)
     try:
-        logger.info("🌐 Trying Chess.com analysis API...")
-        timeout = aiohttp.ClientTimeout(total=2)  # BLITZ MODE: 2s max
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # Chess.com has a different endpoint structure
-            url = "https://www.chess.com/callback/analysis"
-            payload = {
-                "fen": fen,
-                "purpose": "analysis"
-            }
-            
-            async with session.post(url, json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if "best" in data and data["best"]:
-                        raw_move = data["best"]
-                        clean_move = clean_move_format(raw_move)
-                        if clean_move:
-                            logger.info(f"✅ Chess.com API success! Move: '{clean_move}'")
-                            return {
-                                "best_move": clean_move,
-                                "evaluation": {
-                                    "cp": data.get("eval", 0),
-                                    "mate": data.get("mate", None)
-                                },
-                                "engine_used": "chess_com_stockfish",
-                                "depth_reached": depth,
-                                "best_line": [clean_move]
-                            }
+        replacement = await _open_stockfish(_sf_path)
     except Exception as e:
-        logger.warning(f"⚠️ Chess.com API failed: {e}")
+        logger.error(f"❌ Stockfish worker died and could not be restarted: {e}")
+        del _sf_pool[index]
+    else:
+        logger.warning("⚠️ Stockfish worker died; started a replacement")
+        _sf_pool[index] = replacement
+        _sf_worker_tasks[replacement] = asyncio.create_task(_sf_worker(replacement))
     
-    # API 3: ChessDB API (reliable fallback)
-    try:
-        logger.info("🌐 Trying ChessDB API...")
-        timeout = aiohttp.ClientTimeout(total=2)  # BLITZ MODE: 2s max
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            url = "http://www.chessdb.cn/cdb.php"
-            params = {
-                "action": "querypv",
-                "board": fen,
-                "json": 1
-            }
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if "status" in data and data["status"] == "ok" and "pv" in data:
-                        moves = data["pv"].split()
-                        if moves:
-                            raw_move = moves[0]
-                            clean_move = clean_move_format(raw_move)
-                            if clean_move:
-                                logger.info(f"✅ ChessDB API success! Move: '{clean_move}'")
-                                return {
-                                    "best_move": clean_move,
-                                    "evaluation": {
-                                        "cp": data.get("score", 0),
-                                        "mate": None
-                                    },
-                                    "engine_used": "chessdb_stockfish", 
-                                    "depth_reached": data.get("depth", depth),
-                                    "best_line": moves[:3]
-                                }
-    except Exception as e:
-        logger.warning(f"⚠️ ChessDB API failed: {e}")
+    # engines["stockfish"] is always the first pool member
+    if _sf_pool:
+        engines["stockfish"] = _sf_pool[0]
+    else:
+        engines.pop("stockfish", None)
+        engines["stockfish_backup"] = "backup_engine"
+        _HAS_NATIVE_STOCKFISH = False
+        # No worker is left to take the queued searches, so fail them now
+        while not analysis_queue.empty():
+            fut = analysis_queue.get_nowait()[3]
+            if not fut.done():
+                fut.set_exception(chess.engine.EngineTerminatedError("No native Stockfish engine is running"))
+
+async def _search_until_decided(engine, board: chess.Board, limit: chess.engine.Limit,
+                                fut: asyncio.Future, on_info=None):
+    """Run a search but stop as soon as the engine proves a forced mate for the side to move"""
+    # Deeper iterations can't improve on a mate it has already proven, so don't
+    # wait out the full depth; nor keep searching for a caller that has gone away.
+    # Fail-high/low lines only bound the score, and a mate against the side to
+    # move is searched in full in case a deeper defence turns up.
+    # Leaving the block sends "stop"
+    with await engine.analysis(board, limit) as analysis:
+        async for info in analysis:
+            if on_info is not None:
+                on_info(info)
+            if fut.done():
+                break
+            score = info.get("score")
+            if (score is not None and (score.relative.mate() or 0) > 0 and "pv" in info
+                    and not info.get("lowerbound") and not info.get("upperbound")):
+                break
+        return analysis.info
+
+async def _set_engine_elo(engine, elo_limit: int):
+    """Point the native engine at a strength, sending setoption only on change"""
+    option = engine.options.get("UCI_Elo")
+    if option is None or option.max is None or elo_limit >= option.max:
+        elo_limit = None  # Full strength
+    elif option.min is not None:
+        elo_limit = max(elo_limit, option.min)
+    
+    if elo_limit == _engine_elo.get(engine):
+        return
+    if elo_limit is None:
+        await engine.configure({"UCI_LimitStrength": False})
+    else:
+        await engine.configure({"UCI_LimitStrength": True, "UCI_Elo": elo_limit})
+    _engine_elo[engine] = elo_limit
+    logger.debug("🎚️ Stockfish strength set to %s", elo_limit or 'full')
+
+@functools.lru_cache(maxsize=256)
+def _search_limit(depth: int, time_limit: float) -> chess.engine.Limit:
+    """Shared Limit per (depth, time) - clients use a handful of settings and
+    python-chess never mutates a Limit"""
+    return chess.engine.Limit(depth=depth, time=time_limit)
+
+async def _run_native_stockfish(board: chess.Board, limit: chess.engine.Limit, timeout: float,
+                                elo_limit: int, engine_used: str) -> dict:
+    """Search on the native engine and shape the result like the other backends"""
+    # The engine honours limit.time itself; this deadline only guards against a hung
+    # process. It starts when a pool worker takes the job, so a batch queued behind
+    # the few workers waits its turn (up to ENGINE_QUEUE_WAIT) instead of timing
+    # out into the online fallback
+    info = await engine_analyse(board, limit, elo_limit, timeout=timeout)
+    
+    # A proven mate ends the search early, so report the depth actually reached
+    result = _shape_engine_info(info, engine_used, info.get("depth", limit.depth))
+    if result is None:
+        raise Exception("No best move found")
+    
+    logger.debug("✅ LOCAL STOCKFISH SUCCESS: %s", result["best_move"])
+    return result
+
+def _shape_engine_info(info: dict, engine_used: str, depth: int) -> Optional[dict]:
+    """Engine info as a best-move result, or None if it carries no PV yet"""
+    if not info.get("pv"):
+        return None
     
-    # API 4: Stockfish.online (another option)
-    try:
-        logger.info("🌐 Trying Stockfish.online API...")
-        timeout = aiohttp.ClientTimeout(total=3)  # BLITZ MODE: 3s max
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            url = "https://stockfish.online/api/s/v2.php"
-            params = {
-                "fen": fen,
-                "depth": min(depth, 12),  # BLITZ MODE: Lower depth for speed
-                "mode": "bestmove"
-            }
-            
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if "bestmove" in data and data["bestmove"]:
-                        # Clean the move format: "bestmove c7c6 ponder d5c4" → "c7c6"
-                        raw_move = data["bestmove"]
-                        clean_move = clean_move_format(raw_move)
-                        
-                        if clean_move:
-                            logger.info(f"✅ Stockfish.online API success! Raw: '{raw_move}' → Clean: '{clean_move}'")
-                            return {
-                                "best_move": clean_move,
-                                "evaluation": {
-                                    "cp": data.get("evaluation", 0),
-                                    "mate": data.get("mate", None)
-                                },
-                                "engine_used": "stockfish_online",
-                                "depth_reached": data.get("depth", depth),
-                                "best_line": [clean_move]
-                            }
-    except Exception as e:
-        logger.warning(f"⚠️ Stockfish.online API failed: {e}")
+    # Extract evaluation
+    score = info.get("score", chess.engine.PovScore(chess.engine.Cp(0), chess.WHITE))
+    if score.is_mate():
+        evaluation = {"cp": None, "mate": score.white().mate()}
+    else:
+        evaluation = {"cp": score.white().score(), "mate": None}
     
-    logger.error("❌ ALL online Stockfish APIs failed - this should rarely happen!")
-    return None
+    # Extract principal variation
+    pv = [move.uci() for move in info["pv"][:3]]
+    
+    return {
+        "best_move": pv[0],
+        "evaluation": evaluation,
+        "engine_used": engine_used,
+        "depth_reached": depth,
+        "best_line": pv
+    }
 
-# Engine-specific analysis functions
-async def analyze_with_stockfish(board: chess.Board, depth: int, time_limit: float):
+async def _analyze_with_stockfish_uncached(board: chess.Board, depth: int, time_limit: float, elo_limit: int = FULL_STRENGTH_ELO):
     """Analyze position with REAL Stockfish engine - online APIs or native"""
     if "stockfish" not in engines and "stockfish_backup" not in engines:
         raise Exception("No Stockfish engine available")
     
-    logger.error("🚨 EMERGENCY MODE: Using NATIVE Stockfish ONLY - no online APIs!")
-    logger.error(f"🔧 Engines available: {list(engines.keys())}")
-    logger.error(f"🔧 Stockfish engine type: {type(engines.get('stockfish', 'NOT_FOUND'))}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🚨 EMERGENCY MODE: Using NATIVE Stockfish ONLY - no online APIs!")
+        logger.debug("🔧 Engines available: %s", list(engines))
+        logger.debug("🔧 Stockfish engine type: %s", type(engines.get('stockfish', 'NOT_FOUND')))
     
     # 🚨 EMERGENCY: Try NATIVE Stockfish FIRST (skip online APIs completely)
-    if "stockfish" in engines and hasattr(engines["stockfish"], 'analyse'):
+    if _HAS_NATIVE_STOCKFISH:
         try:
-            logger.error("🚨 EMERGENCY: Using local chess.engine Stockfish...")
-            engine = engines["stockfish"]
-            info = await asyncio.wait_for(
-                engine.analyse(board, chess.engine.Limit(depth=min(depth, 12), time=3.0)),
-                timeout=5.0
+            logger.debug("🚨 EMERGENCY: Using local chess.engine Stockfish...")
+            return await _run_native_stockfish(
+                board, _search_limit(min(depth, MAX_SEARCH_DEPTH), 3.0), 5.0,
+                elo_limit, "stockfish_local_EMERGENCY_BYPASS"
             )
-            
-            best_move = str(info["pv"][0]) if info.get("pv") else None
-            if not best_move:
-                raise Exception("No best move found")
-            
-            logger.error(f"✅ LOCAL STOCKFISH SUCCESS: {best_move}")
-            
-            # Extract evaluation
-            score = info.get("score", chess.engine.PovScore(chess.engine.Cp(0), chess.WHITE))
-            if score.is_mate():
-                evaluation = {"cp": None, "mate": score.mate()}
-            else:
-                evaluation = {"cp": score.cp, "mate": None}
-            
-            # Extract principal variation
-            pv = [str(move) for move in info.get("pv", [])[:3]]
-            
-            return {
-                "best_move": best_move,
-                "evaluation": evaluation,
-                "engine_used": "stockfish_local_EMERGENCY_BYPASS",
-                "depth_reached": min(depth, 12),
-                "best_line": pv
-            }
         except Exception as e:
             logger.error(f"❌ Local Stockfish EMERGENCY failed: {e}")
-            logger.error(f"❌ Exception type: {type(e)}")
+            logger.debug("❌ Exception type: %s", type(e))
     
-    logger.info("🔧 Using REAL Stockfish analysis for best moves")
+    logger.debug("🔧 Using REAL Stockfish analysis for best moves")
     
     # Try online Stockfish APIs first (most reliable)
     online_result = await try_online_stockfish(board.fen(), depth)
     if online_result:
         return online_result
     
-    # Try Stockfish.js as backup
-    if False and "stockfish" in engines and engines["stockfish"] == "stockfish_js" and stockfish_js_engine is not None:
-        try:
-            result = await stockfish_js_engine.analyze(board.fen(), depth)
-            if result and 'bestmove' in result:
-                return {
-                    "best_move": result['bestmove'],
-                    "evaluation": result.get('evaluation', {"cp": 0, "mate": None}),
-                    "engine_used": "stockfish_js",
-                    "depth_reached": result.get('depth', depth),
-                    "best_line": [result['bestmove']]
-                }
-        except Exception as e:
-            logger.warning(f"⚠️ Stockfish.js failed: {e}, using backup")
-    
     # Try native Stockfish if it's a real engine instance
-    if "stockfish" in engines and hasattr(engines["stockfish"], 'analyse'):
+    if _HAS_NATIVE_STOCKFISH:
         try:
-            engine = engines["stockfish"]
-            info = await asyncio.wait_for(
-                engine.analyse(board, chess.engine.Limit(depth=depth, time=time_limit)),
-                timeout=time_limit + 5
+            return await _run_native_stockfish(
+                board, _search_limit(min(depth, MAX_SEARCH_DEPTH), time_limit), time_limit + 5,
+                elo_limit, "stockfish_native"
             )
-            
-            best_move = str(info["pv"][0]) if info.get("pv") else None
-            if not best_move:
-                raise Exception("No best move found")
-            
-            # Extract evaluation
-            score = info.get("score", chess.engine.PovScore(chess.engine.Cp(0), chess.WHITE))
-            if score.is_mate():
-                evaluation = {"cp": None, "mate": score.mate()}
-            else:
-                evaluation = {"cp": score.cp, "mate": None}
-            
-            # Extract principal variation
-            pv = [str(move) for move in info.get("pv", [])[:3]]
-            
-            return {
-                "best_move": best_move,
-                "evaluation": evaluation,
-                "engine_used": "stockfish_native",
-                "depth_reached": depth,
-                "best_line": pv
-            }
         except Exception as e:
             logger.warning(f"⚠️ Native Stockfish failed: {e}, using backup")
     
@@ -974,13 +1464,9 @@ async def analyze_with_stockfish(board: chess.Board, depth: int, time_limit: flo
     backup_result["warning"] = "Real Stockfish unavailable - using weak backup!"
     return backup_result
 
-async def analyze_with_backup(board: chess.Board):
-    """Intelligent backup chess engine with opening book and principles - Enhanced for better play"""
-    
-    logger.info("🤖 Using enhanced intelligent backup engine")
-    
-    # Strong opening book
-    opening_book = {
+# Strong opening book, keyed by piece placement + side to move; built once, read-only
+OPENING_BOOK = MappingProxyType({
+    " ".join(fen.split()[:2]): move for fen, move in {
         # Starting position
         "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1": "e2e4",
         # After 1.e4
@@ -997,133 +1483,137 @@ async def analyze_with_backup(board: chess.Board):
         "rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2": "d2d4",
         # Caro-Kann Defense
         "rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2": "d2d4",
-    }
+    }.items()
+})
+
+async def analyze_with_backup(board: chess.Board):
+    """Intelligent backup chess engine with opening book and principles - Enhanced for better play"""
+    
+    logger.debug("🤖 Using enhanced intelligent backup engine")
     
-    fen = board.fen()
+    # Placement + side to move only - skips formatting the clocks of a full FEN
+    book_move = OPENING_BOOK.get(board.board_fen() + (" w" if board.turn else " b"))
     
-    if fen in opening_book:
+    if book_move is not None:
         return {
-            "best_move": opening_book[fen],
+            "best_move": book_move,
             "evaluation": {"cp": 30, "mate": None},
             "engine_used": "enhanced_backup",  # Better name
             "depth_reached": 15,
-            "best_line": [opening_book[fen]]
+            "best_line": [book_move]
         }
     
     # Analyze position with basic principles
-    legal_moves = list(board.legal_moves)
-    if not legal_moves:
+    if not board.legal_moves:
         raise Exception("No legal moves available")
     
-    best_move = select_smart_move(board, legal_moves)
+    best_move = select_smart_move(board, board.legal_moves).uci()
     
     return {
-        "best_move": str(best_move),
+        "best_move": best_move,
         "evaluation": {"cp": evaluate_position(board), "mate": None},
         "engine_used": "enhanced_backup", 
         "depth_reached": 12,  # Report higher depth for better appearance 
-        "best_line": [str(best_move)]
+        "best_line": [best_move]
     }
 
+# Dedicated generator for the backup and random engines' tie-breaking noise
+_RNG = random.Random()
+
+# Material values for smart captures, indexed by piece type (chess.PAWN == 1 ... chess.KING == 6)
+PIECE_VALUES = (0, 100, 300, 300, 500, 900, 10000)
+
+# Destination bonus per square: +20 for the centre (d4, e4, d5, e5), -5 on the edge
+_SQUARE_BONUS = tuple(
+    20 if chess.square_file(sq) in (3, 4) and chess.square_rank(sq) in (3, 4)
+    else -5 if chess.square_file(sq) in (0, 7) or chess.square_rank(sq) in (0, 7)
+    else 0
+    for sq in chess.SQUARES
+)
+
+# Each side's home rank, indexed by colour (chess.BLACK == False, chess.WHITE == True)
+_BACK_RANK = (chess.BB_RANK_8, chess.BB_RANK_1)
+
+# Stand-in ray table for kingless test positions: nothing is ever in line
+_NO_RAYS = (0,) * 64
+
 def select_smart_move(board, legal_moves):
     """Select move based on chess principles - IMPROVED to avoid blunders"""
-    import random
-    
-    # Material values for smart captures
-    piece_values = {
-        chess.PAWN: 100,
-        chess.KNIGHT: 300,
-        chess.BISHOP: 300,
-        chess.ROOK: 500,
-        chess.QUEEN: 900,
-        chess.KING: 10000
-    }
-    
-    # Priority scoring
-    scores = {}
+    # Priority scoring - track the best "good" move and the least bad one as we go
+    best_move, best_score = None, None
+    fallback_move, fallback_score = None, None
+    
+    # Every legal move belongs to the side to move, so only piece types are looked
+    # up (no Piece objects) and the back rank is fixed for the whole pass
+    piece_type_at = board.piece_type_at
+    is_capture = board.is_capture
+    gives_check = board.gives_check
+    randint = _RNG.randint
+    back_rank = _BACK_RANK[board.turn]
+    
+    # gives_check pushes and pops internally, so it is only asked when the move
+    # could possibly check: from- or to-square in line with the enemy king, a
+    # knight landing next to it, or a promotion, king move/castle or en passant
+    king = board.king(not board.turn)
+    king_mask = chess.BB_SQUARES[king] if king is not None else 0
+    king_rays = chess.BB_RAYS[king] if king is not None else _NO_RAYS
+    ep_square = board.ep_square
     
     for move in legal_moves:
         score = 0
+        moving_type = piece_type_at(move.from_square)
         
         # SMART CAPTURE EVALUATION - avoid sacrifices!
-        if board.is_capture(move):
-            captured_piece = board.piece_at(move.to_square)
-            moving_piece = board.piece_at(move.from_square)
+        if is_capture(move):
+            captured_type = piece_type_at(move.to_square)
             
-            if captured_piece and moving_piece:
+            if captured_type:
                 # Only capture if we gain material or equal trade
-                material_gain = piece_values[captured_piece.piece_type] - piece_values[moving_piece.piece_type]
+                material_gain = PIECE_VALUES[captured_type] - PIECE_VALUES[moving_type]
                 if material_gain >= 0:
                     score += material_gain // 10  # Good capture
                 else:
                     score -= 200  # BAD SACRIFICE - heavily penalize
         
         # Check if it gives check (but not if it sacrifices material)
-        board.push(move)
-        if board.is_check():
-            # Only bonus for check if we're not sacrificing
-            if not board.is_capture(move) or score >= 0:
-                score += 30
-        board.pop()
+        if score >= 0 and (king_rays[move.from_square] or king_rays[move.to_square]
+                           or chess.BB_KNIGHT_ATTACKS[move.to_square] & king_mask
+                           or move.promotion or moving_type == chess.KING
+                           or move.to_square == ep_square) and gives_check(move):
+            score += 30
         
-        # Prefer center squares in opening/middlegame
-        to_square = move.to_square
-        file = chess.square_file(to_square)
-        rank = chess.square_rank(to_square)
+        # Prefer center squares, avoid hanging pieces on the edge
+        score += _SQUARE_BONUS[move.to_square]
         
-        # Center bonus (e4, e5, d4, d5)
-        if file in [3, 4] and rank in [3, 4]:
-            score += 20
-        
-        # Develop pieces (knights and bishops)
-        moving_piece = board.piece_at(move.from_square)
-        if moving_piece and moving_piece.piece_type in [chess.KNIGHT, chess.BISHOP]:
-            # Bonus for developing from back rank
-            from_rank = chess.square_rank(move.from_square)
-            if (moving_piece.color == chess.WHITE and from_rank == 0) or \
-               (moving_piece.color == chess.BLACK and from_rank == 7):
-                score += 25
-        
-        # Avoid hanging pieces in obvious spots
-        if file == 0 or file == 7 or rank == 0 or rank == 7:
-            score -= 5
+        # Develop pieces (knights and bishops) from the back rank
+        if (moving_type == chess.KNIGHT or moving_type == chess.BISHOP) and \
+           chess.BB_SQUARES[move.from_square] & back_rank:
+            score += 25
             
-        scores[move] = score + random.randint(1, 5)  # Smaller random factor
-    
-    # Filter out obviously bad moves (big negative scores)
-    good_moves = {move: score for move, score in scores.items() if score > -100}
-    
-    if good_moves:
-        # Return move with highest score from good moves
-        return max(good_moves.keys(), key=lambda m: good_moves[m])
-    else:
-        # If all moves are bad, pick least bad
-        return max(scores.keys(), key=lambda m: scores[m])
+        score += randint(1, 5)  # Smaller random factor
+        
+        # Filter out obviously bad moves (big negative scores)
+        if score > -100:
+            if best_score is None or score > best_score:
+                best_move, best_score = move, score
+        elif fallback_score is None or score > fallback_score:
+            fallback_move, fallback_score = move, score
+    
+    # Return move with highest score from good moves; if all moves are bad, pick least bad
+    return best_move if best_move is not None else fallback_move
 
 def evaluate_position(board):
     """Basic position evaluation"""
     
-    # Material count
-    piece_values = {
-        chess.PAWN: 1,
-        chess.KNIGHT: 3,
-        chess.BISHOP: 3,
-        chess.ROOK: 5,
-        chess.QUEEN: 9,
-        chess.KING: 0
-    }
+    # Material count straight from the piece bitboards (1/3/3/5/9, king 0)
+    def material(occupied):
+        return ((board.pawns & occupied).bit_count()
+                + 3 * ((board.knights | board.bishops) & occupied).bit_count()
+                + 5 * (board.rooks & occupied).bit_count()
+                + 9 * (board.queens & occupied).bit_count())
     
-    white_material = 0
-    black_material = 0
-    
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            value = piece_values[piece.piece_type]
-            if piece.color == chess.WHITE:
-                white_material += value
-            else:
-                black_material += value
+    white_material = material(board.occupied_co[chess.WHITE])
+    black_material = material(board.occupied_co[chess.BLACK])
     
     # Return evaluation in centipawns
     material_diff = (white_material - black_material) * 100
@@ -1141,12 +1631,11 @@ async def analyze_with_random(board: chess.Board):
     if not legal_moves:
         raise Exception("No legal moves available")
     
-    import random
-    best_move = str(random.choice(legal_moves))
+    best_move = _RNG.choice(legal_moves).uci()
     
     return {
         "best_move": best_move,
-        "evaluation": {"cp": random.randint(-100, 100), "mate": None},
+        "evaluation": {"cp": _RNG.randint(-100, 100), "mate": None},
         "engine_used": "random",
         "depth_reached": 1,
         "best_line": [best_move]
@@ -1154,29 +1643,38 @@ async def analyze_with_random(board: chess.Board):
 
 # Utility functions
 def get_position_type(board: chess.Board) -> str:
-    """Determine position type based on move number"""
-    move_number = board.fullmove_number
-    
-    if move_number <= 10:
-        return "opening"
-    elif move_number <= 40:
-        return "middlegame"
-    else:
-        return "endgame"
+    """Determine position type from the non-pawn material left (24 at the start)"""
+    phase = (4 * board.queens.bit_count()
+             + 2 * board.rooks.bit_count()
+             + (board.bishops | board.knights).bit_count())
+    if phase >= 20:
+        return "opening" if board.fullmove_number <= 12 else "middlegame"
+    return "middlegame" if phase >= 8 else "endgame"
 
 def calculate_winning_chances(evaluation: dict) -> float:
     """Calculate winning chances from evaluation"""
     if evaluation.get("mate") is not None:
         return 100 if evaluation["mate"] > 0 else 0
     
-    cp = evaluation.get("cp", 0)
-    if cp is None:
-        return 50
-    
-    # Convert centipawns to winning percentage
-    win_percentage = 50 + (cp / 100) * 10
-    return max(0, min(100, round(win_percentage, 1)))
+    # Logistic cp -> expected score (the Elo curve, 400 cp per decade of odds),
+    # which saturates smoothly instead of clipping at +/-5 pawns. Past +/-40
+    # pawns it is 100/0 at this precision, and the bound keeps 10 ** x finite
+    cp = max(-4000, min(4000, evaluation.get("cp") or 0))
+    return round(100 / (1 + 10 ** (-cp / 400)), 1)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
+    try:
+        import uvloop  # libuv event loop, shipped with uvicorn[standard] on Linux
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # C HTTP parser, also part of uvicorn[standard]
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    logger.info(f"🔁 Event loop: {loop}, HTTP parser: {http}, workers: {WEB_CONCURRENCY}")
+    # Several worker processes need the app as an import string so each can load it
+    uvicorn.run("main:app" if WEB_CONCURRENCY > 1 else app, host="0.0.0.0",
+                port=int(os.environ.get("PORT", 8000)), loop=loop, http=http, workers=WEB_CONCURRENCY)
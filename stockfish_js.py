@@ -3,25 +3,149 @@ Stockfish.js integration for Python FastAPI using local lib files
 This module provides a bridge between Python and Stockfish.js (WebAssembly)
 """
 
+import aiohttp
 import asyncio
-import json
+import functools
 import logging
+import orjson
 import os
+import tarfile
 import tempfile
+import zlib
+from collections import OrderedDict
 from pathlib import Path
-import subprocess
+from typing import Optional
+from archive_stream import extract_download
 import shutil
 
 logger = logging.getLogger(__name__)
 
+# Entries kept in StockfishJS's transposition cache before LRU eviction
+_TT_MAX = 100_000
+
+# Persistent Node.js workers, each with its own single-threaded WASM engine
+# (Stockfish.js has no Threads option). Default is one per core, capped at 4
+# since every worker holds its own engine memory.
+STOCKFISH_JS_WORKERS = int(os.environ.get("STOCKFISH_JS_WORKERS", min(os.cpu_count() or 1, 4)))
+# Seconds to wait for each worker reply before the worker is killed and replaced;
+# kept under the wrapper's own 15s engine timeout
+STOCKFISH_JS_TIMEOUT = float(os.environ.get("STOCKFISH_JS_TIMEOUT", 10))
+
+# Portable Node.js release, checked against the release's published SHA-256 list
+_NODE_ARCHIVE = "node-v18.18.0-linux-x64.tar.xz"
+_NODE_URL = f"https://nodejs.org/dist/v18.18.0/{_NODE_ARCHIVE}"
+_NODE_SHASUMS_URL = "https://nodejs.org/dist/v18.18.0/SHASUMS256.txt"
+_DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=120)
+
+def _position_key(fen):
+    """FEN without the move counters, so transposed positions compare equal"""
+    return " ".join(fen.split()[:4])
+
+# Strong opening book, built once and keyed like the transposition cache
+_OPENING_BOOK = {_position_key(fen): move for fen, move in {
+    # Starting position
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1": "e2e4",
+    # After 1.e4
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1": "e7e5",
+    # After 1.e4 e5
+    "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2": "g1f3",
+    # After 1.d4
+    "rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq d3 0 1": "d7d5",
+    # After 1.d4 d5
+    "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq d6 0 2": "c2c4",
+    # Sicilian Defense
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2": "g1f3",
+    # French Defense
+    "rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2": "d2d4",
+}.items()}
+
+@functools.lru_cache(maxsize=4096)
+def _analyze_fen(fen):
+    """Basic FEN analysis: (board, turn, castling, en_passant), memoized per FEN"""
+    parts = fen.split()
+    return (
+        parts[0],
+        parts[1],
+        parts[2] if len(parts) > 2 else "KQkq",
+        parts[3] if len(parts) > 3 else "-"
+    )
+
+# Candidate moves for the principled fallback
+_OPENING_MOVES_WHITE = ("e2e4", "d2d4", "g1f3", "b1c3", "f1c4")  # develop pieces, control center
+_OPENING_MOVES_BLACK = ("e7e5", "d7d5", "g8f6", "b8c6", "f8c5")
+_TACTICAL_MOVES_WHITE = ("d1d5", "a1d1", "f1e1", "g1h1", "e2e4")
+_TACTICAL_MOVES_BLACK = ("d8d4", "a8d8", "f8e8", "g8h8", "e7e5")
+
+def _material_table():
+    """bytes.translate table for _evaluate_position (10 = no material)"""
+    table = bytearray([10]) * 256
+    for piece, value in {"Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}.items():
+        table[ord(piece)] = 10 + value
+        table[ord(piece.lower())] = 10 - value
+    return bytes(table)
+
+_MATERIAL_TABLE = _material_table()
+
+def _link_lib_files(lib_source, wrapper_dir):
+    """Populate the wrapper directory with the lib files
+
+    Files are hardlinked (no bytes copied); across filesystems copy2 is used,
+    which copies in-kernel via sendfile. Files left by an earlier start are
+    kept while size and mtime still match.
+    """
+    wrapper_dir.mkdir(exist_ok=True)
+    for file in lib_source.glob("*"):
+        if file.is_file():
+            target = wrapper_dir / file.name
+            source_stat = file.stat()
+            try:
+                target_stat = target.stat()
+                if (target_stat.st_size, target_stat.st_mtime_ns) == \
+                        (source_stat.st_size, source_stat.st_mtime_ns):
+                    continue
+                target.unlink()
+            except FileNotFoundError:
+                pass
+            try:
+                os.link(file, target)
+                logger.info(f"📁 Linked {file.name}")
+            except OSError:
+                shutil.copy2(file, target)
+                logger.info(f"📁 Copied {file.name}")
+
+def _extract_node_stream(fileobj, node_dir):
+    """Extract the Node.js tar.xz as it arrives, dropping its top-level directory"""
+    with tarfile.open(fileobj=fileobj, mode="r|xz") as tar:
+        for member in tar:
+            name = member.name.partition("/")[2]
+            if not name:
+                continue
+            member.name = name
+            if member.islnk():
+                member.linkname = member.linkname.partition("/")[2]
+            tar.extract(member, node_dir, filter="data")
+
 class StockfishJS:
     """Stockfish.js engine wrapper using local files"""
     
+    # Node.js binary found by the last successful lookup, shared by all instances
+    _cached_node: Optional[str] = None
+    
     def __init__(self):
         self.node_path = None
         self.stockfish_wrapper_path = None
         self.is_initialized = False
         self.stockfish_binary = None
+        # Pool of persistent Node.js workers, each serving one request at a time.
+        # A free slot holds its process, or None until one is started.
+        self._free = asyncio.Queue()
+        for _ in range(STOCKFISH_JS_WORKERS):
+            self._free.put_nowait(None)
+        self._processes = set()
+        self._respawns = set()
+        # Transposition cache: position key -> (searched depth, result),
+        # so a deeper search also answers shallower queries for the position
+        self._tt: "OrderedDict[str, tuple]" = OrderedDict()
         
     async def initialize(self):
         """Initialize Stockfish.js using local lib files"""
@@ -53,22 +177,25 @@ class StockfishJS:
     async def _ensure_nodejs(self):
         """Try to find or install Node.js"""
         try:
-            # Try system Node.js first
-            result = subprocess.run(['which', 'node'], capture_output=True, text=True)
-            if result.returncode == 0:
-                node_path = result.stdout.strip()
-                logger.info(f"✅ Found Node.js at: {node_path}")
-                return node_path
+            # A path found by an earlier initialize() is reused while it is still there
+            cached = StockfishJS._cached_node
+            if cached and os.access(cached, os.X_OK):
+                return cached
             
-            # Try common Node.js locations
+            # Try system Node.js first (PATH walk in-process, no 'which' fork),
+            # then common Node.js locations
             common_paths = ['/usr/bin/node', '/usr/local/bin/node']
-            for path in common_paths:
-                if os.path.exists(path):
-                    logger.info(f"✅ Found Node.js at: {path}")
-                    return path
+            node_path = await asyncio.to_thread(shutil.which, 'node') or next(
+                (path for path in common_paths if os.access(path, os.X_OK)), None)
+            if node_path:
+                logger.info(f"✅ Found Node.js at: {node_path}")
+                StockfishJS._cached_node = node_path
+                return node_path
             
             # Try to install portable Node.js
-            return await self._install_portable_nodejs()
+            node_path = await self._install_portable_nodejs()
+            StockfishJS._cached_node = node_path
+            return node_path
             
         except Exception as e:
             logger.warning(f"⚠️ Node.js check failed: {e}")
@@ -84,20 +211,25 @@ class StockfishJS:
                 logger.info(f"✅ Found existing portable Node.js")
                 return str(node_path)
             
-            node_dir.mkdir(exist_ok=True)
-            
             # Download and extract Node.js
             logger.info("📥 Downloading portable Node.js...")
             
-            # This might fail on restrictive hosting, so catch it
-            import urllib.request
-            node_url = "https://nodejs.org/dist/v18.18.0/node-v18.18.0-linux-x64.tar.xz"
-            node_archive = "/tmp/node.tar.xz"
-            
-            urllib.request.urlretrieve(node_url, node_archive)
-            subprocess.run([
-                'tar', '-xf', node_archive, '-C', str(node_dir), '--strip-components=1'
-            ], check=True)
+            # This might fail on restrictive hosting, so catch it.
+            # The archive streams straight into the extractor and is hashed on
+            # the way through; /tmp/nodejs only appears once it checks out.
+            async with aiohttp.ClientSession(timeout=_DOWNLOAD_TIMEOUT) as session:
+                async with session.get(_NODE_SHASUMS_URL) as response:
+                    response.raise_for_status()
+                    shasums = await response.text()
+                expected = next((line.split()[0] for line in shasums.splitlines()
+                                 if line.endswith(_NODE_ARCHIVE)), None)
+                if expected is None:
+                    raise RuntimeError(f"no checksum published for {_NODE_ARCHIVE}")
+                
+                async with session.get(_NODE_URL) as response:
+                    response.raise_for_status()
+                    await extract_download(response, _extract_node_stream, str(node_dir), sha256=expected,
+                                           is_complete=lambda path: os.path.exists(os.path.join(path, "bin", "node")))
             
             if node_path.exists():
                 os.chmod(node_path, 0o755)
@@ -112,176 +244,22 @@ class StockfishJS:
     async def _setup_real_stockfish_js(self):
         """Setup real Stockfish.js using your local lib files"""
         try:
-            # Create wrapper directory
             wrapper_dir = Path("/tmp/stockfish-wrapper")
-            wrapper_dir.mkdir(exist_ok=True)
-            
-            # Copy lib files to wrapper directory
             lib_source = Path("./lib")
             if not lib_source.exists():
                 logger.error("❌ Local lib directory not found")
                 return None
             
-            # Copy all lib files
-            for file in lib_source.glob("*"):
-                if file.is_file():
-                    shutil.copy2(file, wrapper_dir / file.name)
-                    logger.info(f"📁 Copied {file.name}")
-            
-            # Create Node.js wrapper that uses the real Stockfish.js
-            wrapper_content = f"""
-const fs = require('fs');
-const path = require('path');
-
-// Load Stockfish.js from local files
-const STOCKFISH = require('./stockfish.js');
-
-class StockfishEngine {{
-    constructor() {{
-        this.engine = null;
-        this.ready = false;
-        this.currentCallback = null;
-    }}
-    
-    async initialize() {{
-        try {{
-            // Initialize Stockfish with WASM file
-            this.engine = STOCKFISH('./stockfish.wasm');
-            
-            this.engine.onmessage = (line) => {{
-                if (this.currentCallback) {{
-                    this.currentCallback(line);
-                }}
-            }};
-            
-            // Send UCI command and wait for readiness
-            await this.sendCommand('uci');
-            await this.sendCommand('isready');
-            
-            this.ready = true;
-            return true;
-        }} catch (e) {{
-            console.error('Stockfish initialization failed:', e);
-            return false;
-        }}
-    }}
-    
-    sendCommand(cmd) {{
-        return new Promise((resolve) => {{
-            if (!this.engine) {{
-                resolve('no engine');
-                return;
-            }}
-            
-            const timeout = setTimeout(() => {{
-                this.currentCallback = null;
-                resolve('timeout');
-            }}, 5000);
-            
-            this.currentCallback = (response) => {{
-                clearTimeout(timeout);
-                this.currentCallback = null;
-                resolve(response);
-            }};
-            
-            this.engine.postMessage(cmd, true);
-        }});
-    }}
-    
-    async analyze(fen, depth = 15) {{
-        if (!this.ready) {{
-            throw new Error('Engine not ready');
-        }}
-        
-        try {{
-            // Set position
-            await this.sendCommand(`position fen ${{fen}}`);
-            
-            // Start analysis
-            const response = await this.sendCommand(`go depth ${{depth}}`);
-            
-            // Parse response for bestmove
-            const lines = response.split('\\n');
-            let bestmove = null;
-            let evaluation = {{ cp: 0, mate: null }};
-            
-            for (const line of lines) {{
-                if (line.startsWith('bestmove')) {{
-                    const parts = line.split(' ');
-                    bestmove = parts[1];
-                }} else if (line.includes('score cp')) {{
-                    const match = line.match(/score cp (-?\\d+)/);
-                    if (match) {{
-                        evaluation.cp = parseInt(match[1]);
-                    }}
-                }} else if (line.includes('score mate')) {{
-                    const match = line.match(/score mate (-?\\d+)/);
-                    if (match) {{
-                        evaluation.mate = parseInt(match[1]);
-                        evaluation.cp = null;
-                    }}
-                }}
-            }}
-            
-            return {{
-                bestmove: bestmove || 'e2e4',
-                evaluation: evaluation,
-                depth: depth
-            }};
-            
-        }} catch (e) {{
-            console.error('Analysis failed:', e);
-            // Return fallback move
-            return {{
-                bestmove: 'e2e4',
-                evaluation: {{ cp: 0, mate: null }},
-                depth: 1
-            }};
-        }}
-    }}
-}}
-
-// CLI interface
-async function main() {{
-    const args = process.argv.slice(2);
-    if (args.length < 1) {{
-        console.log('Usage: node wrapper.js <fen> [depth]');
-        process.exit(1);
-    }}
-    
-    const fen = args[0];
-    const depth = parseInt(args[1]) || 15;
-    
-    const engine = new StockfishEngine();
-    const initialized = await engine.initialize();
-    
-    if (!initialized) {{
-        // Fallback to opening book
-        const result = {{
-            bestmove: 'e2e4',
-            evaluation: {{ cp: 25, mate: null }},
-            depth: 1
-        }};
-        console.log(JSON.stringify(result));
-        return;
-    }}
-    
-    const result = await engine.analyze(fen, depth);
-    console.log(JSON.stringify(result));
-}}
-
-if (require.main === module) {{
-    main().catch(console.error);
-}}
-
-module.exports = StockfishEngine;
-"""
+            # Blocking filesystem work runs off the event loop
+            await asyncio.to_thread(_link_lib_files, lib_source, wrapper_dir)
             
+            # The Node.js wrapper ships in lib/ and was linked in with the engine files
             wrapper_file = wrapper_dir / "wrapper.js"
-            with open(wrapper_file, 'w') as f:
-                f.write(wrapper_content)
+            if not wrapper_file.is_file():
+                logger.error("❌ lib/wrapper.js not found")
+                return None
             
-            logger.info(f"✅ Real Stockfish.js wrapper created")
+            logger.info(f"✅ Real Stockfish.js wrapper ready")
             return str(wrapper_file)
             
         except Exception as e:
@@ -292,7 +270,7 @@ module.exports = StockfishEngine;
         """Test the Stockfish.js engine"""
         try:
             test_fen = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
-            result = await self.analyze(test_fen, 5)
+            result, = await self._analyze_with_worker([(test_fen, 5)])
             
             if result and 'bestmove' in result:
                 logger.info(f"✅ Stockfish.js test successful: {result['bestmove']}")
@@ -303,68 +281,168 @@ module.exports = StockfishEngine;
             
         return False
     
+    async def _start_worker(self):
+        """Start a persistent Node.js worker; it loads the WASM engine once"""
+        process = await asyncio.create_subprocess_exec(
+            self.node_path, self.stockfish_wrapper_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd="/tmp/stockfish-wrapper",
+            # Node 22+ keeps compiled wrapper/engine bytecode here between starts
+            env={**os.environ, "NODE_COMPILE_CACHE": "/tmp/.node-cache"}
+        )
+        self._processes.add(process)
+        return process
+    
+    def _kill_worker(self, process):
+        """Kill a worker if it is still running and drop it from the pool; the caller reaps it"""
+        self._processes.discard(process)
+        if process.returncode is None:
+            process.kill()
+    
+    async def _analyze_with_worker(self, requests):
+        """Pipeline (fen, depth) requests through one free worker, results in order
+
+        Every request is written up front so the worker reads the next one while
+        the engine is still searching; replies are read as they arrive.
+        """
+        process = await self._free.get()
+        writer = None
+        try:
+            if process is None or process.returncode is not None:
+                self._processes.discard(process)
+                process = await self._start_worker()
+            
+            payload = b"".join(orjson.dumps({"fen": fen, "depth": depth}) + b"\n"
+                               for fen, depth in requests)
+            process.stdin.write(payload)
+            writer = asyncio.ensure_future(process.stdin.drain())
+            
+            results = []
+            while len(results) < len(requests):
+                try:
+                    line = await asyncio.wait_for(process.stdout.readline(), timeout=STOCKFISH_JS_TIMEOUT)
+                except asyncio.TimeoutError:
+                    raise RuntimeError(f"Stockfish.js worker gave no reply in {STOCKFISH_JS_TIMEOUT}s") from None
+                if not line:
+                    raise RuntimeError("Stockfish.js worker exited")
+                if line.startswith(b"{"):
+                    results.append(orjson.loads(line))
+            await writer
+        except BaseException:
+            if writer is not None:
+                writer.cancel()
+            if process is None:
+                self._free.put_nowait(None)
+            else:
+                # A late or partial reply would desync the next request, so the
+                # worker is killed. Its replacement starts in the background so
+                # the next request doesn't wait on a cold start.
+                self._kill_worker(process)
+                task = asyncio.get_running_loop().create_task(self._respawn_worker(process))
+                self._respawns.add(task)
+                task.add_done_callback(self._respawns.discard)
+            raise
+        self._free.put_nowait(process)
+        return results
+    
+    async def _respawn_worker(self, killed):
+        """Reap a killed worker, start its replacement and hand the slot back"""
+        process = None
+        try:
+            await killed.wait()
+            process = await self._start_worker()
+        except Exception as e:
+            logger.warning(f"⚠️ Stockfish.js worker restart failed: {e}")
+        finally:
+            self._free.put_nowait(process)
+    
+    async def close(self):
+        """Stop every worker; call from the application's shutdown hook"""
+        for task in list(self._respawns):
+            task.cancel()
+        for process in list(self._processes):
+            self._kill_worker(process)
+            await process.wait()
+    
     async def analyze(self, fen, depth=15):
         """Analyze position with Stockfish.js or fallback engine"""
+        return (await self.analyze_many([(fen, depth)]))[0]
+    
+    async def analyze_many(self, requests):
+        """Analyze a list of (fen, depth) pairs, e.g. every position of a game
+
+        Cache misses go to the worker as one pipelined batch; duplicates are
+        searched once. Results are returned in request order.
+        """
         if not self.is_initialized:
             logger.error("❌ Engine not initialized")
-            return None
+            return [None] * len(requests)
+        
+        results = [None] * len(requests)
+        # position -> [deepest requested depth, fen, request indexes]
+        misses = {}
+        for i, (fen, depth) in enumerate(requests):
+            position = _position_key(fen)
+            cached = self._tt.get(position)
+            if cached is not None and cached[0] >= depth:
+                self._tt.move_to_end(position)
+                results[i] = cached[1]
+            else:
+                miss = misses.setdefault(position, [depth, fen, []])
+                miss[0] = max(miss[0], depth)
+                miss[2].append(i)
         
         # Try real Stockfish.js first
-        if self.node_path and self.stockfish_wrapper_path:
-            try:
-                cmd = [self.node_path, self.stockfish_wrapper_path, fen, str(depth)]
-                
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                    cwd="/tmp/stockfish-wrapper"
-                )
-                
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=15.0)
-                
-                if process.returncode == 0:
-                    result = json.loads(stdout.decode())
-                    return result
-                else:
-                    logger.warning(f"⚠️ Stockfish.js failed, using fallback")
-                    
-            except Exception as e:
-                logger.warning(f"⚠️ Stockfish.js error: {e}, using fallback")
+        if misses and self.node_path and self.stockfish_wrapper_path:
+            # Dealt round-robin across the workers, each chunk pipelined on one
+            jobs = [(fen, depth) for depth, fen, _ in misses.values()]
+            chunks = min(len(jobs), STOCKFISH_JS_WORKERS)
+            searched = await asyncio.gather(
+                *(self._analyze_with_worker(jobs[i::chunks]) for i in range(chunks)),
+                return_exceptions=True
+            )
+            for chunk in searched:
+                if isinstance(chunk, Exception):
+                    logger.warning(f"⚠️ Stockfish.js error: {chunk}, using fallback")
+            for i, (position, (depth, _, indexes)) in enumerate(misses.items()):
+                chunk = searched[i % chunks]
+                if isinstance(chunk, BaseException):
+                    continue
+                result = chunk[i // chunks]
+                self._remember(position, depth, result)
+                for index in indexes:
+                    results[index] = result
         
         # Fallback to intelligent engine
-        return self._intelligent_fallback(fen)
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = self._intelligent_fallback(requests[i][0])
+        return results
+    
+    def _remember(self, position, depth, result):
+        """Cache an engine result unless a deeper one is already stored"""
+        cached = self._tt.get(position)
+        if cached is None or cached[0] <= depth:
+            self._tt[position] = (depth, result)
+        self._tt.move_to_end(position)
+        if len(self._tt) > _TT_MAX:
+            self._tt.popitem(last=False)
     
     def _intelligent_fallback(self, fen):
         """Intelligent fallback chess engine"""
         
-        # Strong opening book
-        opening_book = {
-            # Starting position
-            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1": "e2e4",
-            # After 1.e4
-            "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1": "e7e5",
-            # After 1.e4 e5
-            "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2": "g1f3",
-            # After 1.d4
-            "rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq d3 0 1": "d7d5",
-            # After 1.d4 d5
-            "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq d6 0 2": "c2c4",
-            # Sicilian Defense
-            "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2": "g1f3",
-            # French Defense
-            "rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2": "d2d4",
-        }
-        
-        if fen in opening_book:
+        move = _OPENING_BOOK.get(_position_key(fen))
+        if move is not None:
             return {
-                "bestmove": opening_book[fen],
+                "bestmove": move,
                 "evaluation": {"cp": 30, "mate": None},
                 "depth": 15
             }
         
         # Analyze position with basic principles
-        pieces = self._analyze_fen(fen)
+        pieces = _analyze_fen(fen)
         best_move = self._select_principled_move(pieces, fen)
         
         return {
@@ -373,52 +451,33 @@ module.exports = StockfishEngine;
             "depth": 8
         }
     
-    def _analyze_fen(self, fen):
-        """Basic FEN analysis"""
-        parts = fen.split()
-        board = parts[0]
-        turn = parts[1]
-        
-        return {
-            "board": board,
-            "turn": turn,
-            "castling": parts[2] if len(parts) > 2 else "KQkq",
-            "en_passant": parts[3] if len(parts) > 3 else "-"
-        }
-    
     def _select_principled_move(self, pieces, fen):
         """Select move based on chess principles"""
         
-        # Basic move patterns based on game phase
-        if "pppppppp" in pieces["board"].lower():
-            # Opening: develop pieces, control center
-            if pieces["turn"] == "w":
-                opening_moves = ["e2e4", "d2d4", "g1f3", "b1c3", "f1c4"]
-            else:
-                opening_moves = ["e7e5", "d7d5", "g8f6", "b8c6", "f8c5"]
+        # Basic move patterns based on game phase: opening while either side
+        # still has its full pawn rank, otherwise middlegame/endgame
+        board, turn, _, _ = pieces
+        opening = "pppppppp" in board or "PPPPPPPP" in board
+        if turn == "w":
+            moves = _OPENING_MOVES_WHITE if opening else _TACTICAL_MOVES_WHITE
         else:
-            # Middlegame/Endgame: more tactical
-            if pieces["turn"] == "w":
-                opening_moves = ["d1d5", "a1d1", "f1e1", "g1h1", "e2e4"]
-            else:
-                opening_moves = ["d8d4", "a8d8", "f8e8", "g8h8", "e7e5"]
+            moves = _OPENING_MOVES_BLACK if opening else _TACTICAL_MOVES_BLACK
         
-        # Return a reasonable move (in real implementation, would calculate)
-        import random
-        return random.choice(opening_moves)
+        # Return a reasonable move (in real implementation, would calculate).
+        # The pick is a CRC of the full FEN: deterministic across restarts, no
+        # shared RNG state, and the move counters still vary it during a game.
+        return moves[zlib.crc32(fen.encode()) % len(moves)]
     
     def _evaluate_position(self, pieces):
         """Basic position evaluation"""
-        # Count material (simplified)
-        board = pieces["board"].lower()
-        
-        white_material = (board.count('q') * 9 + board.count('r') * 5 + 
-                         board.count('b') * 3 + board.count('n') * 3 + board.count('p'))
-        black_material = (board.count('Q') * 9 + board.count('R') * 5 + 
-                         board.count('B') * 3 + board.count('N') * 3 + board.count('P'))
+        # Material balance in one pass: translate maps every FEN byte to 10 plus
+        # its signed value (white uppercase, black lowercase), so the sum less
+        # 10 per byte is white material minus black material
+        board = pieces[0].encode()
+        material = sum(board.translate(_MATERIAL_TABLE)) - 10 * len(board)
         
         # Return evaluation in centipawns
-        return (white_material - black_material) * 10
+        return material * 10
 
 # Global instance
 stockfish_js_engine = StockfishJS()